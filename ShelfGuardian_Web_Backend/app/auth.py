@@ -5,9 +5,10 @@ from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, read_session
 from app.models import User
 from app.schemas import TokenData
+from app.tracing import span
 import os
 
 # Security configuration
@@ -71,16 +72,40 @@ async def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        token_data = TokenData(email=email)
-    except JWTError:
-        raise credentials_exception
-    user = get_user_by_email(db, email=token_data.email)
+    user = get_user_from_token(db, token)
     if user is None:
         raise credentials_exception
     return user
 
+
+def get_user_from_token(db: Session, token: str) -> Optional[User]:
+    """Resolve a JWT access token to its user, or None if it is invalid"""
+    with span("auth.lookup"):
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            email: str = payload.get("sub")
+            if email is None:
+                return None
+            token_data = TokenData(email=email)
+        except JWTError:
+            return None
+        user = get_user_by_email(db, email=token_data.email)
+        # Tokens of a deleted account must not work for a new account that
+        # reuses its email
+        if user is not None and payload.get("user_id", user.id) != user.id:
+            return None
+        return user
+
+
+
+def get_user_read_db(current_user: User = Depends(get_current_user)):
+    """Read-only session for the current user's own data.
+
+    Served by the replica unless the user wrote recently, in which case the
+    primary is used so they see their own changes.
+    """
+    db = read_session(current_user.id)
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,193 @@
+"""Optional merging of duplicate products on insert (PostgreSQL and SQLite).
+
+With PRODUCT_MERGE_DUPLICATES=true, adding a product that matches one the user
+already has (same name ignoring case and surrounding spaces, same category and
+expiry date) adds to that product's quantity instead of creating another row.
+A unique expression index on the merge key backs this up, and inserts use
+INSERT ... ON CONFLICT DO UPDATE, so concurrent adds of the same item can't
+race into duplicates or lose an increment.
+
+A merged product keeps its id and gets a new version, so clients can tell a
+merge (version > 1) from a fresh row. The index includes expiry_date, the
+partition key, so it also works on the partitioned products table.
+
+The first start with merging on folds existing duplicates together before
+creating the index; turning it off again drops the index.
+"""
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable, List
+from sqlalchemy import bindparam, delete, func, insert, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models import Product, ProductTombstone
+from app.serialization import PRODUCT_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_MERGE_DUPLICATES = os.getenv("PRODUCT_MERGE_DUPLICATES", "false").lower() in ("1", "true", "yes")
+
+MERGE_INDEX = "ux_products_merge_key"
+# Must match the index expression for ON CONFLICT to find the index
+MERGE_KEY = (Product.user_id, func.lower(func.trim(Product.name)), Product.category, Product.expiry_date)
+
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+# Rows per DELETE when folding existing duplicates
+_CHUNK = 500
+
+
+def merging(dialect: str) -> bool:
+    return PRODUCT_MERGE_DUPLICATES and dialect in _UPSERT_INSERTS
+
+
+def _merge_key(row: dict):
+    return row["user_id"], row["name"].strip().lower(), row["category"], row["expiry_date"]
+
+
+def combine_duplicates(rows: Iterable[dict]) -> List[dict]:
+    """Collapse rows sharing a merge key into one, adding up their quantities.
+
+    PostgreSQL rejects an INSERT ... ON CONFLICT that would update the same
+    row twice, so a batch has to be free of duplicates itself.
+    """
+    combined = {}
+    for row in rows:
+        key = _merge_key(row)
+        if key in combined:
+            first = combined[key]
+            first["quantity"] = (first.get("quantity") or 1) + (row.get("quantity") or 1)
+        else:
+            combined[key] = dict(row)
+    return list(combined.values())
+
+
+def insert_products(dialect: str, rows: List[dict]):
+    """INSERT of product `rows` returning PRODUCT_COLUMNS; merges into existing rows when merging is on"""
+    now = datetime.utcnow()
+    rows = [{**row, "updated_at": now} for row in rows]
+    if not merging(dialect):
+        return insert(Product).values(rows).returning(*PRODUCT_COLUMNS)
+
+    stmt = _UPSERT_INSERTS[dialect](Product).values(combine_duplicates(rows))
+    return stmt.on_conflict_do_update(
+        index_elements=MERGE_KEY,
+        set_={
+            "quantity": func.coalesce(Product.quantity, 1) + func.coalesce(stmt.excluded.quantity, 1),
+            "version": Product.version + 1,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    ).returning(*PRODUCT_COLUMNS)
+
+
+# A partition's copy of the merge index, which is what PostgreSQL reports
+# when a row of a partitioned table violates it
+_PARTITION_INDEX_OF = (
+    "SELECT 1 FROM pg_inherits i "
+    "JOIN pg_class child ON child.oid = i.inhrelid "
+    "JOIN pg_class parent ON parent.oid = i.inhparent "
+    "WHERE child.relname = :index AND parent.relname = :parent"
+)
+
+
+def is_merge_conflict(db: Session, error: IntegrityError) -> bool:
+    """Whether `error` violated the merge-key index; call after rolling back"""
+    dialect = db.get_bind().dialect.name
+    if not merging(dialect):
+        return False
+    if dialect == "sqlite":
+        return f"index '{MERGE_INDEX}'" in str(error.orig)
+    name = getattr(getattr(error.orig, "diag", None), "constraint_name", None)
+    if name is None:
+        return False
+    if name == MERGE_INDEX:
+        return True
+    return db.execute(text(_PARTITION_INDEX_OF), {"index": name, "parent": MERGE_INDEX}).first() is not None
+
+
+# ------------------------------------------------
+# Schema
+# ------------------------------------------------
+# Reflection skips expression indexes on SQLite, so ask the catalogs directly
+_INDEX_EXISTS = {
+    "postgresql": "SELECT 1 FROM pg_indexes WHERE schemaname = current_schema() AND indexname = :name",
+    "sqlite": "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name",
+}
+
+
+def _has_merge_index(engine: Engine) -> bool:
+    with engine.connect() as conn:
+        return conn.execute(text(_INDEX_EXISTS[engine.dialect.name]), {"name": MERGE_INDEX}).first() is not None
+
+
+def merge_existing_duplicates(conn) -> int:
+    """Fold every group of duplicate products into its oldest row; returns rows removed.
+
+    Removed rows get tombstones so delta sync clients drop them, and the
+    surviving rows get the summed quantity and a new version.
+    """
+    ranked = select(
+        Product.id,
+        Product.user_id,
+        func.coalesce(Product.quantity, 1).label("quantity"),
+        func.min(Product.id).over(partition_by=MERGE_KEY).label("keep_id"),
+        func.count().over(partition_by=MERGE_KEY).label("copies"),
+    ).subquery()
+    rows = conn.execute(
+        select(ranked.c.id, ranked.c.user_id, ranked.c.quantity, ranked.c.keep_id).where(ranked.c.copies > 1)
+    ).all()
+    if not rows:
+        return 0
+
+    totals = defaultdict(int)
+    extra = []
+    for row in rows:
+        totals[row.keep_id] += row.quantity
+        if row.id != row.keep_id:
+            extra.append(row)
+
+    now = datetime.utcnow()
+    conn.execute(
+        update(Product.__table__)
+        .where(Product.__table__.c.id == bindparam("keep_id"))
+        .values(quantity=bindparam("total"), version=Product.__table__.c.version + 1, updated_at=now),
+        [{"keep_id": keep_id, "total": total} for keep_id, total in totals.items()],
+    )
+    conn.execute(insert(ProductTombstone), [
+        {"product_id": row.id, "user_id": row.user_id, "deleted_at": now} for row in extra
+    ])
+    ids = [row.id for row in extra]
+    for start in range(0, len(ids), _CHUNK):
+        conn.execute(delete(Product.__table__).where(Product.__table__.c.id.in_(ids[start:start + _CHUNK])))
+    return len(ids)
+
+
+def setup_product_merge(engine: Engine):
+    """Create (or, with merging off, drop) the unique merge-key index. Run after setup_partitioning."""
+    dialect = engine.dialect.name
+    if not PRODUCT_MERGE_DUPLICATES:
+        if dialect in _UPSERT_INSERTS and _has_merge_index(engine):
+            logger.info("Product merging is off; dropping %s", MERGE_INDEX)
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP INDEX IF EXISTS {MERGE_INDEX}"))
+        return
+    if dialect not in _UPSERT_INSERTS:
+        logger.warning("PRODUCT_MERGE_DUPLICATES is only supported on PostgreSQL and SQLite; ignoring it")
+        return
+    if _has_merge_index(engine):
+        return
+
+    with engine.begin() as conn:
+        if dialect == "postgresql":
+            # Keep other workers from adding duplicates until the index exists
+            conn.execute(text(f"LOCK TABLE {Product.__tablename__} IN SHARE ROW EXCLUSIVE MODE"))
+        merged = merge_existing_duplicates(conn)
+        if merged:
+            logger.info("Merged %d duplicate products", merged)
+        conn.execute(text(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {MERGE_INDEX} "
+            f"ON {Product.__tablename__} (user_id, lower(trim(name)), category, expiry_date)"
+        ))
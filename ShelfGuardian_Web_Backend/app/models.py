@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Enum as SQLEnum
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Index, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from app.database import Base
 import enum
@@ -12,6 +13,8 @@ class ProductCategory(str, enum.Enum):
 
 class User(Base):
     __tablename__ = "users"
+    # Never reuse a deleted user's id on SQLite: tokens are bound to it
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True, nullable=False)
@@ -19,7 +22,9 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     
     # Relationship with products
-    products = relationship("Product", back_populates="owner", cascade="all, delete-orphan")
+    # passive_deletes: deleting a user leaves the products to the database's
+    # ON DELETE CASCADE instead of loading and deleting them one by one
+    products = relationship("Product", back_populates="owner", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Product(Base):
@@ -31,8 +36,49 @@ class Product(Base):
     expiry_date = Column(Date, nullable=False)
     quantity = Column(Integer, default=1)
     description = Column(String, nullable=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # Change tracking for delta sync (app.sync): every write bumps both
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     
     # Relationship with user
     owner = relationship("User", back_populates="products")
 
+    __table_args__ = (
+        Index("ix_products_user_updated", "user_id", "updated_at", "id"),
+        # Never reuse a deleted product's id on SQLite: sync tombstones refer to it
+        {"sqlite_autoincrement": True},
+    )
+
+
+class ArchivedProduct(Base):
+    """Expired product moved out of `products` by the daily cleanup, kept for waste analytics"""
+    __tablename__ = "products_archive"
+
+    id = Column(Integer, primary_key=True)
+    # id the row had in products; not the key, since products ids can be reused
+    product_id = Column(Integer, nullable=False, index=True)
+    name = Column(String, nullable=False)
+    category = Column(SQLEnum(ProductCategory), nullable=False)
+    expiry_date = Column(Date, nullable=False)
+    quantity = Column(Integer, default=1)
+    user_id = Column(Integer, nullable=False)  # plain column: archived rows aren't tied to live users
+    archived_at = Column(Date, nullable=False, index=True)
+
+    __table_args__ = (
+        Index("ix_products_archive_user_expiry", "user_id", "expiry_date"),
+    )
+
+
+class ProductTombstone(Base):
+    """Record of a deleted product, so delta sync can tell clients to drop it"""
+    __tablename__ = "product_tombstones"
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_product_tombstones_user_deleted", "user_id", "deleted_at", "id"),
+    )
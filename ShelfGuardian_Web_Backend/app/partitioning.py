@@ -0,0 +1,180 @@
+"""Optional monthly range partitioning of `products` by `expiry_date` (PostgreSQL only).
+
+With partitioning on, expiry cleanup detaches and drops whole months instead of
+deleting row by row, and expiry range filters prune to the matching months.
+The ORM model is unchanged: `id` stays unique via its sequence, while the
+table's primary key becomes (id, expiry_date) as PostgreSQL requires the
+partition key in every unique constraint.
+
+Enable with PRODUCTS_PARTITIONING=true. The first start converts an existing
+table in one transaction (it takes an exclusive lock while copying rows).
+"""
+import logging
+import os
+import re
+from datetime import date
+from typing import Callable, List, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+PARTITIONING_ENABLED = os.getenv("PRODUCTS_PARTITIONING", "false").lower() in ("1", "true", "yes")
+PARTITION_MONTHS_AHEAD = int(os.getenv("PRODUCTS_PARTITION_MONTHS_AHEAD", "24"))
+
+TABLE = "products"
+DEFAULT_PARTITION = "products_default"
+_PARTITION_NAME = re.compile(r"^products_y(\d{4})m(\d{2})$")
+
+
+def _month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def _add_months(d: date, months: int) -> date:
+    month = d.month - 1 + months
+    return date(d.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"products_y{month.year:04d}m{month.month:02d}"
+
+
+def supports_partitioning(engine: Engine) -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def is_partitioned(conn: Connection) -> bool:
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt "
+        "JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :table AND c.relnamespace = current_schema()::regnamespace"
+    ), {"table": TABLE}).first() is not None
+
+
+def attached_partitions(conn: Connection) -> List[str]:
+    rows = conn.execute(text(
+        "SELECT child.relname FROM pg_inherits i "
+        "JOIN pg_class parent ON parent.oid = i.inhparent "
+        "JOIN pg_class child ON child.oid = i.inhrelid "
+        "WHERE parent.relname = :table AND parent.relnamespace = current_schema()::regnamespace"
+    ), {"table": TABLE})
+    return [r[0] for r in rows]
+
+
+def _create_month_partition(conn: Connection, month: date):
+    """Create and attach the partition for `month`, moving any matching rows out of the default partition."""
+    name = partition_name(month)
+    lower, upper = month.isoformat(), _add_months(month, 1).isoformat()
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)"))
+    conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+        f"WHERE expiry_date >= :lower AND expiry_date < :upper RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), {"lower": lower, "upper": upper})
+    conn.execute(text(
+        f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')"
+    ))
+
+
+def ensure_partitions(conn: Connection, start: date, months_ahead: int = PARTITION_MONTHS_AHEAD) -> int:
+    """Make sure monthly partitions exist from `start` through `months_ahead` months from today."""
+    existing = set(attached_partitions(conn))
+    month = _month_start(start)
+    last = _add_months(_month_start(date.today()), months_ahead)
+    created = 0
+    while month <= last:
+        if partition_name(month) not in existing:
+            _create_month_partition(conn, month)
+            created += 1
+        month = _add_months(month, 1)
+    return created
+
+
+def convert_products_table(engine: Engine):
+    """Rebuild a plain `products` table as a partitioned one, keeping rows, ids and indexes."""
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            return
+        logger.info("Converting products table to monthly partitions")
+        conn.execute(text(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE"))
+        oldest = conn.execute(text(f"SELECT min(expiry_date) FROM {TABLE}")).scalar() or date.today()
+
+        conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO products_unpartitioned"))
+        conn.execute(text(
+            f"CREATE TABLE {TABLE} (LIKE products_unpartitioned INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE (expiry_date)"
+        ))
+        # Keep the id sequence alive when the old table is dropped
+        conn.execute(text(f"ALTER SEQUENCE products_id_seq OWNED BY {TABLE}.id"))
+        conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"))
+        ensure_partitions(conn, oldest)
+        conn.execute(text(f"INSERT INTO {TABLE} SELECT * FROM products_unpartitioned"))
+        conn.execute(text("DROP TABLE products_unpartitioned"))
+
+        conn.execute(text(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id, expiry_date)"))
+        conn.execute(text(
+            f"ALTER TABLE {TABLE} ADD CONSTRAINT products_user_id_fkey "
+            f"FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE"
+        ))
+        conn.execute(text(f"CREATE INDEX ix_products_id ON {TABLE} (id)"))
+        conn.execute(text(f"CREATE INDEX ix_products_name ON {TABLE} (name)"))
+        conn.execute(text(f"CREATE INDEX ix_products_user_expiry ON {TABLE} (user_id, expiry_date)"))
+        conn.execute(text(f"CREATE INDEX ix_products_user_updated ON {TABLE} (user_id, updated_at, id)"))
+
+
+def setup_partitioning(engine: Engine):
+    """Convert `products` if needed and create partitions for the months ahead."""
+    if not PARTITIONING_ENABLED:
+        return
+    if not supports_partitioning(engine):
+        logger.warning("PRODUCTS_PARTITIONING is only supported on PostgreSQL; ignoring it")
+        return
+    convert_products_table(engine)
+    create_future_partitions(engine)
+
+
+def create_future_partitions(engine: Engine) -> int:
+    """Scheduled job: keep PARTITION_MONTHS_AHEAD months of partitions ahead of today."""
+    if not supports_partitioning(engine):
+        return 0
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return 0
+        created = ensure_partitions(conn, date.today())
+    if created:
+        logger.info("Created %d product partitions", created)
+    return created
+
+
+def drop_partitions_before(
+    engine: Engine,
+    cutoff: date,
+    before_drop: Optional[Callable[[Connection, str], None]] = None,
+) -> Optional[int]:
+    """Detach and drop monthly partitions that end on or before `cutoff`.
+
+    `before_drop(conn, partition)` runs in the same transaction just before a
+    partition is detached, e.g. to copy its rows elsewhere. Returns the number
+    of rows removed, or None when the table isn't partitioned (callers then
+    fall back to a row-level delete).
+    """
+    if not supports_partitioning(engine):
+        return None
+    removed = 0
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return None
+        for name in sorted(attached_partitions(conn)):
+            match = _PARTITION_NAME.match(name)
+            if not match:
+                continue
+            month = date(int(match.group(1)), int(match.group(2)), 1)
+            if _add_months(month, 1) > cutoff:
+                continue
+            removed += conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+            if before_drop is not None:
+                before_drop(conn, name)
+            conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+            conn.execute(text(f"DROP TABLE {name}"))
+    return removed
@@ -6,6 +6,7 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import User
 from app.schemas import UserCreate, UserResponse
+from app.services.accounts import delete_account
 from app.auth import (
     get_current_user,
     get_password_hash,
@@ -16,22 +17,20 @@ from app.auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+def register(user: UserCreate, db: Session = Depends(get_db)):
     """Register a new user"""
-    logger.info(f"Received registration request for email: {user.email}")
+    logger.debug("Received registration request for email: %s", user.email)
 
     # Check if email already exists
     db_user = get_user_by_email(db, email=user.email)
     if db_user:
-        logger.warning(f"Registration failed: Email {user.email} already exists")
+        logger.warning("Registration failed: Email %s already exists", user.email)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
@@ -55,7 +54,7 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
-    logger.info(f"User registered successfully: {user.email}")
+    logger.info("User registered successfully: %s", user.email)
     return db_user
 
 
@@ -65,18 +64,18 @@ async def login(
     db: Session = Depends(get_db)
 ):
     """Login and get access token"""
-    logger.info(f"Login attempt for username: {form_data.username}")
+    logger.debug("Login attempt for username: %s", form_data.username)
 
     user = authenticate_user(db, form_data.username, form_data.password)
     if not user:
-        logger.warning(f"Login failed for username: {form_data.username}")
+        logger.warning("Login failed for username: %s", form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    logger.info(f"Login successful for user: {user.email}")
+    logger.info("Login successful for user: %s", user.email)
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
     # ✅ Correct token payload: store email in sub + user_id
@@ -103,3 +102,14 @@ async def get_current_user_info(
 ):
     """Get current user information"""
     return current_user
+
+
+@router.delete("/me", status_code=status.HTTP_204_NO_CONTENT)
+def delete_current_user(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Delete the current user's account with all their products, archive and sync history"""
+    user_id = current_user.id
+    removed = delete_account(db, user_id)
+    logger.info("Deleted account %s with %d products", user_id, removed)
@@ -1,8 +1,15 @@
-from fastapi import APIRouter
+import logging
+from typing import Optional
+from fastapi import APIRouter, Header, Response
 from pydantic import BaseModel
 from app.schema.chat_schema import ChatRequest, ChatResponse
 from app.services.chat_service import add_message, get_history, reset_history
-from app.routers.chatbot.langgraph_flow import chat_with_bot
+from app.services.chat_limiter import chat_limiter
+from app.services.idempotency import REPLAY_HEADER, fingerprint, idempotency_store
+from app.services.single_flight import chat_flights, normalize_message
+from app.routers.chatbot.langgraph_flow import achat_with_bot
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["chat"])
 
@@ -10,20 +17,52 @@ class ResetRequest(BaseModel):
     user_id: str
 
 @router.post("/ask", response_model=ChatResponse)
-def ask_chatbot(req: ChatRequest):
+async def ask_chatbot(
+    req: ChatRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+):
+    if not idempotency_key:
+        return await _ask(req)
+
+    # A retry with the same key replays the stored answer; the graph (and any
+    # item it added) runs once. Error answers aren't stored, so retries redo them.
+    answer, replayed = await idempotency_store.arun(
+        "chat.ask", req.user_id, idempotency_key, fingerprint(req.model_dump()),
+        lambda: _ask(req),
+        keep=lambda r: isinstance(r, ChatResponse),
+    )
+    if replayed:
+        response.headers[REPLAY_HEADER] = "true"
+    return answer
+
+
+async def _ask(req: ChatRequest):
+    # Double submits of the same message share one graph run (and one history
+    # entry); only the leading request counts against the limits.
+    key = (req.user_id, normalize_message(req.message))
+    answer, _shared = await chat_flights.do(key, lambda: _answer_limited(req))
+    return answer
+
+
+async def _answer_limited(req: ChatRequest):
+    # Raises 429 (with Retry-After) before any LLM work when over the limits
+    async with chat_limiter.slot(req.user_id):
+        return await _answer(req)
+
+
+async def _answer(req: ChatRequest):
     try:
         user_message = req.message.strip()
-        bot_response = chat_with_bot(user_message, int(req.user_id))
+        bot_response = await achat_with_bot(user_message, int(req.user_id), get_history(req.user_id))
 
         add_message(req.user_id, req.message, bot_response)
         history = get_history(req.user_id)
 
         return ChatResponse(response=bot_response, history=history)
 
-    except Exception as e:
-        import traceback
-        print("[ERROR] Inside /ask route")
-        traceback.print_exc()  # print full backend error
+    except Exception:
+        logger.exception("Chatbot failed inside /ask route")
         return {"response": "⚠️ Internal server error in chatbot", "history": []}
 
 
@@ -0,0 +1,140 @@
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage, ToolMessage
+import json
+import os
+
+from app.routers.chatbot.tool_output import TOOL_ROW_CAP, is_records, trim_records
+
+# ------------------------------------------------
+# 📏 Budgets
+# ------------------------------------------------
+# Rough prompt budgets in tokens. Gemini latency and cost scale with prompt
+# size, and tool outputs for large inventories are the main offender.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CHATBOT_CONTEXT_TOKENS", "6000"))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("CHATBOT_SUMMARY_TOKENS", "3000"))
+TOOL_ITEMS_LIMIT = TOOL_ROW_CAP
+HISTORY_TURNS = int(os.getenv("CHATBOT_HISTORY_TURNS", "3"))
+HISTORY_DIGEST_CHARS = 120
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token), good enough for budgeting."""
+    return len(text or "") // 4 + 1
+
+
+def _message_tokens(messages: list[BaseMessage]) -> int:
+    return sum(estimate_tokens(str(m.content)) for m in messages)
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[: limit - 1] + "…"
+
+
+# ------------------------------------------------
+# 🧰 Tool output compaction
+# ------------------------------------------------
+def compact_tool_output(content: str, max_items: int = TOOL_ITEMS_LIMIT) -> str:
+    """Keep the first `max_items` rows of a structured tool output and count the rest."""
+    try:
+        output = json.loads(content)
+    except (TypeError, ValueError):
+        return content
+    if not is_records(output) or len(output["items"]) <= max_items:
+        return content
+    return json.dumps(trim_records(output, max_items), ensure_ascii=False, separators=(",", ":"))
+
+
+def _compact_tools(messages: list[BaseMessage], max_items: int) -> list[BaseMessage]:
+    compacted = []
+    for m in messages:
+        if isinstance(m, ToolMessage):
+            m = ToolMessage(
+                content=compact_tool_output(m.content, max_items),
+                name=m.name,
+                tool_call_id=m.tool_call_id,
+            )
+        compacted.append(m)
+    return compacted
+
+
+# ------------------------------------------------
+# 🕰️ Chat history
+# ------------------------------------------------
+def history_messages(history: list[dict], turns: int = HISTORY_TURNS) -> list[BaseMessage]:
+    """Recent turns verbatim; older turns folded into a single digest message."""
+    if not history:
+        return []
+    split = max(len(history) - turns, 0)
+    older, recent = history[:split], history[split:]
+
+    messages = []
+    if older:
+        digest = "\n".join(
+            f"- user: {_clip(t['user'], HISTORY_DIGEST_CHARS)} | you: {_clip(t['bot'], HISTORY_DIGEST_CHARS)}"
+            for t in older
+        )
+        messages.append(HumanMessage(content=f"Earlier in this conversation:\n{digest}"))
+    for turn in recent:
+        messages.append(HumanMessage(content=turn["user"]))
+        messages.append(AIMessage(content=turn["bot"]))
+    return messages
+
+
+# ------------------------------------------------
+# 🧱 Context builders
+# ------------------------------------------------
+def build_chat_context(
+    system_prompt: str,
+    user_id: int,
+    messages: list[BaseMessage],
+    history: list[dict] | None = None,
+    budget: int = CONTEXT_TOKEN_BUDGET,
+) -> list[BaseMessage]:
+    """Assemble the chat_node prompt within `budget` tokens.
+
+    The static system prompt always comes first and unchanged so providers can
+    reuse the cached prefix. Per-user context follows it. When over budget we
+    drop history (oldest first) before squeezing tool outputs of the current
+    turn, which is never dropped outright.
+    """
+    prefix = [SystemMessage(content=system_prompt), HumanMessage(content=f"User ID: {user_id}")]
+    past = history_messages(history or [])
+    current = _compact_tools(messages, TOOL_ITEMS_LIMIT)
+
+    def total():
+        return _message_tokens(prefix) + _message_tokens(past) + _message_tokens(current)
+
+    while past and total() > budget:
+        past = past[1:]
+        # Never leave a dangling AI reply without the question it answered
+        if past and isinstance(past[0], AIMessage):
+            past = past[1:]
+
+    max_items = TOOL_ITEMS_LIMIT
+    while max_items > 1 and total() > budget:
+        max_items //= 2
+        current = _compact_tools(messages, max_items)
+
+    return prefix + past + current
+
+
+def build_summary_prompt(header: str, messages: list[BaseMessage], budget: int = SUMMARY_TOKEN_BUDGET) -> str:
+    """Render the summarize_node prompt: the user's question, compacted tool outputs and the model's reply.
+
+    AI messages that only carried tool calls add nothing and are skipped.
+    """
+    def render(max_items):
+        lines = [header]
+        for m in messages:
+            if isinstance(m, AIMessage) and not m.content:
+                continue
+            content = compact_tool_output(m.content, max_items) if isinstance(m, ToolMessage) else m.content
+            lines.append(f"{m.type.upper()}: {content}")
+        return "\n".join(lines)
+
+    max_items = TOOL_ITEMS_LIMIT
+    prompt = render(max_items)
+    while max_items > 1 and estimate_tokens(prompt) > budget:
+        max_items //= 2
+        prompt = render(max_items)
+    return prompt
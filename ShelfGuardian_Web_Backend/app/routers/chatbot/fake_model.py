@@ -0,0 +1,99 @@
+import json
+import re
+import uuid
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from app.routers.chatbot.tool_output import render_tool_output
+
+# Keyword -> tool routing, checked in order; the first match wins
+_ROUTES = [
+    (re.compile(r"\b(add|insert|create)\b"), "add_item_tool"),
+    (re.compile(r"\bexpired\b"), "expired_items_tool"),
+    (re.compile(r"\b(food|medicine|miscellaneous)\b.*\bexpir"), "category_expiry_check_tool"),
+    (re.compile(r"\bexpir"), "expiry_check_tool"),
+    (re.compile(r"\b(food|medicine|miscellaneous)\b"), "category_check_tool"),
+    (re.compile(r"\b(do i have|find|search|where)\b"), "find_item_tool"),
+]
+_CATEGORY = re.compile(r"\b(food|medicine|miscellaneous)\b")
+_USER_ID = re.compile(r"User ID: (\d+)")
+
+
+class LocalFakeChatModel(BaseChatModel):
+    """Deterministic offline stand-in for Gemini (CHATBOT_PROVIDER=fake).
+
+    With tools bound it routes the latest user message to a tool by keyword,
+    and answers in plain text once tool results are in; without tools (the
+    summary step) it renders the tool outputs found in the prompt. Enough to
+    exercise the whole graph in tests and local development without an API key.
+    """
+
+    model_name: str = "fake"
+
+    @property
+    def _llm_type(self) -> str:
+        return "local-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        tools: Optional[list] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if tools:
+            message = self._route(messages, {t["function"]["name"] for t in tools})
+        else:
+            message = AIMessage(content=self._summarize(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _route(self, messages: List[BaseMessage], tool_names: set) -> AIMessage:
+        if isinstance(messages[-1], ToolMessage):
+            return AIMessage(content="Done.")
+        text = next((str(m.content) for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        lowered = text.lower()
+        user_id = 1
+        for m in messages:
+            match = _USER_ID.search(str(m.content))
+            if match:
+                user_id = int(match.group(1))
+                break
+        for pattern, name in _ROUTES:
+            if name in tool_names and pattern.search(lowered):
+                return AIMessage(content="", tool_calls=[{
+                    "name": name,
+                    "args": self._tool_args(name, text, user_id),
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                }])
+        return AIMessage(content="Hello! How can I help with your inventory?")
+
+    @staticmethod
+    def _tool_args(name: str, text: str, user_id: int) -> dict:
+        args = {"user_id": user_id}
+        if name == "add_item_tool":
+            args["item_description"] = text
+        elif name == "find_item_tool":
+            args["query"] = re.sub(r"(?i)^.*?\b(do i have|find|search|where)\b\s*(is|are|for)?\s*", "", text).strip(" ?") or text
+        elif name in ("category_check_tool", "category_expiry_check_tool"):
+            args["category"] = _CATEGORY.search(text.lower()).group(1)
+        return args
+
+    @staticmethod
+    def _summarize(messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(m.content) for m in messages)
+        lines = []
+        for line in prompt.splitlines():
+            if line.startswith("TOOL: "):
+                try:
+                    lines.extend(render_tool_output(json.loads(line[len("TOOL: "):])))
+                except ValueError:
+                    lines.append(line[len("TOOL: "):])
+        return "\n".join(lines) or "Hello! How can I help with your inventory?"
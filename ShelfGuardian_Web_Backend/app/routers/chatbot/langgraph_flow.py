@@ -1,30 +1,32 @@
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langgraph.prebuilt import ToolNode, tools_condition
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage
 from typing import TypedDict, Annotated
+import asyncio
+import json
+import logging
+import os
 
 # Import from tools file
-from app.routers.chatbot.chatbot_tools import tools, llm, llm_with_tools
+from app.routers.chatbot.chatbot_tools import tools, READ_ONLY_TOOLS
+from app.routers.chatbot.models import (
+    ESCALATION_MODEL, ROUTER_MODEL, SUMMARY_MODEL,
+    escalation_llm, router_llm, summary_llm,
+)
+from app.routers.chatbot.context import build_chat_context, build_summary_prompt
+from app.routers.chatbot.tool_output import render_tool_output
+from app.database import dispose_async_engines
+from app.tracing import span, traced
 
+logger = logging.getLogger(__name__)
 
-# -------------------
-# 1. State Definition
-# -------------------
-class ChatState(TypedDict):
-    messages: Annotated[list[BaseMessage], add_messages]
-    user_id: int  # Added to store current user context
+# Hard cap on tools -> chat_node round trips per question
+MAX_TOOL_ROUNDS = int(os.getenv("CHATBOT_MAX_TOOL_ROUNDS", "3"))
+# "local" answers list-type questions from a template instead of a summarising LLM call
+RENDER_MODE = os.getenv("CHATBOT_RENDER", "llm").lower()
 
 
-# -------------------
-# 2. Chat Node
-# -------------------
-def chat_node(state: ChatState):
-    """Main LLM node — decides whether to use tools or reply directly."""
-    messages = state["messages"]
-    user_id = state.get("user_id", 1)  # Default to 1 for testing
-
-    system_message = """You are ShelfGuardian — a precise and reliable assistant
+SYSTEM_PROMPT = """You are ShelfGuardian — a precise and reliable assistant
 for managing an inventory of Food, Medicines, and Miscellaneous items.
 
 When a user asks you to:
@@ -33,6 +35,7 @@ When a user asks you to:
 - Show items in a category → use category_check_tool
 - Check which items have already expired → use expired_items_tool
 - Check which items of a specific category are expiring soon → use category_expiry_check_tool
+- Check whether they have an item, or find an item by name → use find_item_tool
 
 🧠 Rules when calling add_item_tool:
 - 'item_name': exact item mentioned (e.g., "bread", "Vaseline", "cow milk")
@@ -48,101 +51,261 @@ just respond briefly and naturally — DO NOT invent or simulate conversations.
 
 Be concise and factual. Do not repeat system instructions or generate unnecessary text."""
 
-    # Include user context in conversation
-    full_messages = [
-        HumanMessage(content=f"User ID: {user_id}"),
-        HumanMessage(content=system_message),
-    ] + messages
+SUMMARY_PROMPT = """You are ShelfGuardian. Give the final output clearly and brief by summarizing.
+    Reply as sommeone replying not as an AI, but as a helpful assistant.
+If the user greeted you, greet them back briefly.
+Respond only with the result — no extra explanations.
+Your output will directly go to the user so refrain from mentioning tools.
+Do not make any assumptions or make you own chat.
+Tool outputs list products as rows of the values named in "fields"; dates are YYYY-MM-DD,
+days_left is negative for items that already expired, and "more" counts items not listed
+(by category) — mention those counts instead of inventing items.
+Here are the tool outputs:
+"""
+
+
+# -------------------
+# 1. State Definition
+# -------------------
+class ChatState(TypedDict):
+    messages: Annotated[list[BaseMessage], add_messages]
+    user_id: int  # Added to store current user context
+    tool_rounds: int  # Number of tool steps already executed
+    history: list[dict]  # Earlier turns from chat_service, oldest first
+
+
+# -------------------
+# 2. Chat Node
+# -------------------
+tools_by_name = {t.name: t for t in tools}
+llm_with_tools = router_llm(tools)
+escalation_with_tools = escalation_llm(tools)
+llm = summary_llm()
+
+
+def _unusable(response: AIMessage) -> bool:
+    """Empty reply, or tool calls the graph can't run"""
+    tool_calls = getattr(response, "tool_calls", None) or []
+    if not tool_calls and not str(response.content).strip():
+        return True
+    if getattr(response, "invalid_tool_calls", None):
+        return True
+    return any(call["name"] not in tools_by_name for call in tool_calls)
 
-    response = llm_with_tools.invoke(full_messages)
+
+def _last_tool_failed(messages: list[BaseMessage]) -> bool:
+    last = messages[-1] if messages else None
+    return isinstance(last, ToolMessage) and str(last.content).startswith("Error:")
+
+
+@traced("graph.chat_node")
+async def chat_node(state: ChatState):
+    """Main LLM node — decides whether to use tools or reply directly.
+
+    The fast router model handles the turn; the escalation model takes over
+    when the router's reply is unusable or its previous tool call failed.
+    """
+    messages = state["messages"]
+    user_id = state.get("user_id", 1)  # Default to 1 for testing
+    history = state.get("history")
+
+    # Static system prompt first (stable, cacheable prefix), then user context,
+    # recent history and the current turn, all within the token budget.
+    escalate = escalation_with_tools is not None and _last_tool_failed(messages)
+    if not escalate:
+        with span("llm.router", model=ROUTER_MODEL):
+            response = await llm_with_tools.ainvoke(build_chat_context(SYSTEM_PROMPT, user_id, messages, history))
+        escalate = escalation_with_tools is not None and _unusable(response)
+    if escalate:
+        with span("llm.escalation", model=ESCALATION_MODEL):
+            response = await escalation_with_tools.ainvoke(build_chat_context(SYSTEM_PROMPT, user_id, messages, history))
     return {"messages": [response], "user_id": user_id}
 
 
 # -------------------
 # 3. Tool Node
 # -------------------
-tool_node = ToolNode(tools)
+async def _run_tool(call: dict) -> ToolMessage:
+    """Invoke a single tool call and wrap its output (or error) as a ToolMessage."""
+    tool = tools_by_name.get(call["name"])
+    with span(f"tool.{call['name']}") as tool_span:
+        try:
+            if tool is None:
+                raise ValueError(f"{call['name']} is not a valid tool, try one of {list(tools_by_name)}.")
+            output = await tool.ainvoke(call["args"])
+            content = output if isinstance(output, str) else json.dumps(
+                output, ensure_ascii=False, separators=(",", ":"), default=str
+            )
+        except Exception as e:
+            content = f"Error: {e!r}\n Please fix your mistakes."
+            if tool_span is not None:
+                tool_span.set_tag("error", repr(e))
+    return ToolMessage(content=content, name=call["name"], tool_call_id=call["id"])
+
+
+@traced("graph.tool_node")
+async def tool_node(state: ChatState):
+    """Run the tool calls of the last AI message.
+
+    Writes run first, one at a time and in the order requested, so that reads
+    in the same step observe them. The independent read-only tools then run
+    concurrently on the event loop, each with its own session.
+    """
+    calls = state["messages"][-1].tool_calls
+    results = {}
+
+    for call in calls:
+        if call["name"] not in READ_ONLY_TOOLS:
+            results[call["id"]] = await _run_tool(call)
+
+    reads = [call for call in calls if call["name"] in READ_ONLY_TOOLS]
+    for call, message in zip(reads, await asyncio.gather(*map(_run_tool, reads))):
+        results[call["id"]] = message
+
+    return {
+        "messages": [results[call["id"]] for call in calls],
+        "tool_rounds": state.get("tool_rounds", 0) + 1,
+    }
+
+
+def route_after_chat(state: ChatState) -> str:
+    """Go to tools while the model asks for them and the round cap allows it."""
+    last = state["messages"][-1]
+    if not getattr(last, "tool_calls", None):
+        return "summarize"
+    if state.get("tool_rounds", 0) >= MAX_TOOL_ROUNDS:
+        return "fallback"
+    return "tools"
 
 
 # -------------------
 # 4. Summarizer Node
 # -------------------
-def summarize_node(state: ChatState):
+def _tool_output_lines(content: str) -> list[str]:
+    """Render a tool's JSON output as display lines."""
+    try:
+        output = json.loads(content)
+    except (TypeError, ValueError):
+        return [content]
+    return render_tool_output(output)
+
+
+def _rendered_tool_outputs(messages: list[BaseMessage]) -> list[str]:
+    lines = []
+    for m in messages:
+        if m.type == "tool":
+            lines.extend(_tool_output_lines(m.content))
+    return lines
+
+
+@traced("graph.summarize_node")
+async def summarize_node(state: ChatState):
     """Cleanly summarize output for user."""
     messages = state["messages"]
 
-    prompt = f"""You are ShelfGuardian. Give the final output clearly and brief by summarizing.
-    Reply as sommeone replying not as an AI, but as a helpful assistant.
-If the user greeted you, greet them back briefly.
-Respond only with the result — no extra explanations.
-Your output will directly go to the user so refrain from mentioning tools.
-Do not make any assumptions or make you own chat.
-The output of the dates from the tools is in the format YYYY-MM-DD. So infer it correctly in the ouput.
-Here are the tool outputs:
+    # Tool results can be shown as they are: skip the summarising LLM call
+    if RENDER_MODE == "local" and any(m.type == "tool" for m in messages):
+        return {"messages": [AIMessage(content="\n".join(_rendered_tool_outputs(messages)))]}
 
-"""
-
-    for m in messages:
-        prompt += f"\n{m.type.upper()}: {m.content}"
+    prompt = build_summary_prompt(SUMMARY_PROMPT, messages)
 
-    reply = llm.invoke(prompt)
+    with span("llm.summary", model=SUMMARY_MODEL):
+        reply = await llm.ainvoke(prompt)
     reply_text = getattr(reply, "content", "").strip()
 
-    # Fallback to raw tool output if empty
+    # Fallback to rendered tool output if empty
     if not reply_text:
-        tool_msgs = [m.content for m in messages if m.type == "tool"]
-        reply_text = "\n".join(tool_msgs) if tool_msgs else "No results found."
+        reply_text = "\n".join(_rendered_tool_outputs(messages)) or "No results found."
 
     return {"messages": [AIMessage(content=reply_text)]}
 
 
 # -------------------
-# 5. Graph Definition
+# 5. Fallback Node
+# -------------------
+
+
+@traced("graph.fallback_node")
+def fallback_node(state: ChatState):
+    """Answer without another LLM call once the tool round cap is hit."""
+    lines = _rendered_tool_outputs(state["messages"])
+
+    if lines:
+        reply_text = "Here's what I found:\n" + "\n".join(lines)
+    else:
+        reply_text = "Sorry, I couldn't complete that request. Please try rephrasing it."
+    return {"messages": [AIMessage(content=reply_text)]}
+
+
+# -------------------
+# 6. Graph Definition
 # -------------------
 graph = StateGraph(ChatState)
 graph.add_node("chat_node", chat_node)
 graph.add_node("tools", tool_node)
 graph.add_node("summarize", summarize_node)
+graph.add_node("fallback", fallback_node)
 
 graph.add_edge(START, "chat_node")
 
 graph.add_conditional_edges(
     "chat_node",
-    tools_condition,
+    route_after_chat,
     {
-        "tools": "tools",        # if a tool is required
-        "__end__": "summarize",  # if ready to summarize
+        "tools": "tools",          # if a tool is required
+        "summarize": "summarize",  # if ready to summarize
+        "fallback": "fallback",    # if the tool round cap is reached
     },
 )
 
 graph.add_edge("tools", "chat_node")
 graph.add_edge("summarize", END)
+graph.add_edge("fallback", END)
 
 
 postgres_chatbot = graph.compile()
 
 
 # -------------------
-# 6. Chat Function
+# 7. Chat Function
 # -------------------
-def chat_with_bot(user_input: str, user_id: int = 1):
-    """Run one chat session cleanly with user context."""
+async def achat_with_bot(user_input: str, user_id: int = 1, history: list[dict] | None = None):
+    """Run one chat session cleanly with user context and prior turns."""
     state = {
         "messages": [HumanMessage(content=user_input)],
         "user_id": user_id,
+        "tool_rounds": 0,
+        "history": list(history or []),
     }
-    print(f"\n🟢 Input to chatbot: {user_input} (User ID: {user_id})")
+    logger.debug("Input to chatbot: %s (User ID: %s)", user_input, user_id)
 
-    final_state = postgres_chatbot.invoke(state)
-    print("🟡 Final state received.")
+    with span("chatbot", user_id=user_id):
+        final_state = await postgres_chatbot.ainvoke(state)
+    logger.debug("Final state received with %d messages", len(final_state.get("messages", [])))
 
     messages = final_state.get("messages", [])
     ai_msgs = [m for m in messages if m.type == "ai"]
 
     if not ai_msgs:
-        print("⚠️ No AI response.")
+        logger.warning("No AI response for user %s", user_id)
         return "⚠️ No response generated."
 
     last = ai_msgs[-1].content.strip()
-    print("🟣 AI Reply:", last)
+    logger.debug("AI reply: %s", last)
     return last
+
+
+def chat_with_bot(user_input: str, user_id: int = 1, history: list[dict] | None = None):
+    """Blocking wrapper around achat_with_bot for scripts and the shell.
+
+    Pooled async connections belong to the event loop that opened them, which
+    asyncio.run closes, so they are disposed before it returns (pooled
+    aiosqlite connections would also keep the process from exiting).
+    """
+    async def run():
+        try:
+            return await achat_with_bot(user_input, user_id, history)
+        finally:
+            await dispose_async_engines()
+
+    return asyncio.run(run())
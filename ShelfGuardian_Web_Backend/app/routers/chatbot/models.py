@@ -0,0 +1,46 @@
+from functools import lru_cache
+import os
+
+from dotenv import load_dotenv
+from langchain_core.language_models.chat_models import BaseChatModel
+
+load_dotenv()
+
+# ------------------------------------------------
+# 🎚️ Model tiers
+# ------------------------------------------------
+# Each graph step gets the cheapest model that does the job: a fast model
+# routes tool calls, an even lighter one rewrites tool output as a reply, and
+# the large model is only called when the router's answer is unusable.
+CHATBOT_PROVIDER = os.getenv("CHATBOT_PROVIDER", "google").lower()  # "google" or "fake"
+ROUTER_MODEL = os.getenv("CHATBOT_ROUTER_MODEL", "gemini-2.5-flash")
+ESCALATION_MODEL = os.getenv("CHATBOT_ESCALATION_MODEL", "gemini-2.5-pro")
+SUMMARY_MODEL = os.getenv("CHATBOT_SUMMARY_MODEL", "gemini-2.5-flash-lite")
+# Gemini 2.5 caches repeated prompt prefixes implicitly, which is why the
+# system prompt is sent first and never changes between calls.
+
+
+@lru_cache(maxsize=None)
+def chat_model(model: str) -> BaseChatModel:
+    """Shared chat model instance for `model` under CHATBOT_PROVIDER"""
+    if CHATBOT_PROVIDER == "fake":
+        from app.routers.chatbot.fake_model import LocalFakeChatModel
+        return LocalFakeChatModel(model_name=model)
+
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=model)
+
+
+def router_llm(tools):
+    return chat_model(ROUTER_MODEL).bind_tools(tools)
+
+
+def escalation_llm(tools):
+    """Tool-bound large model, or None when escalation would use the router model again"""
+    if ESCALATION_MODEL == ROUTER_MODEL:
+        return None
+    return chat_model(ESCALATION_MODEL).bind_tools(tools)
+
+
+def summary_llm() -> BaseChatModel:
+    return chat_model(SUMMARY_MODEL)
@@ -0,0 +1,110 @@
+from collections import Counter
+from datetime import date
+import os
+
+# ------------------------------------------------
+# 📋 Structured tool output
+# ------------------------------------------------
+# Product tools return rows under a shared header instead of one sentence per
+# product, e.g.
+#   {"fields": ["name", "category", "expiry_date", "days_left"],
+#    "items": [["Milk", "FOOD", "2025-01-20", 5]], "total": 43,
+#    "more": {"count": 42, "by_category": {"FOOD": 30, "MEDICINE": 12}, "expired": 3}}
+# Rows beyond the cap are only counted, so output size no longer grows with
+# the inventory; prompt building may trim further to fit its token budget.
+# Negative days_left means already expired.
+TOOL_ROW_CAP = int(os.getenv("CHATBOT_TOOL_ROW_CAP", "20"))
+RECORD_FIELDS = ("name", "category", "expiry_date", "days_left")
+
+
+def product_records(rows, today: date, fields=RECORD_FIELDS, cap: int = TOOL_ROW_CAP, empty: str = "") -> dict:
+    """Structured tool output for product rows, keeping the first `cap` rows in order"""
+    records = []
+    for r in rows:
+        values = {
+            "name": r.name,
+            "category": r.category.name,
+            "expiry_date": r.expiry_date.isoformat(),
+            "days_left": (r.expiry_date - today).days,
+            "quantity": r.quantity,
+        }
+        records.append([values[f] for f in fields])
+    output = {"fields": list(fields), "items": records, "total": len(records)}
+    if not records and empty:
+        output["message"] = empty
+    return trim_records(output, cap)
+
+
+def trim_records(output: dict, max_items: int) -> dict:
+    """Keep the first `max_items` rows, folding the rest into the `more` counts"""
+    items = output.get("items", [])
+    if len(items) <= max_items:
+        return output
+    fields = output["fields"]
+    kept, dropped = items[:max_items], items[max_items:]
+    more = dict(output.get("more") or {})
+    by_category = Counter(more.get("by_category") or {})
+    expired = more.get("expired", 0)
+    cat = fields.index("category") if "category" in fields else None
+    days = fields.index("days_left") if "days_left" in fields else None
+    for row in dropped:
+        if cat is not None:
+            by_category[row[cat]] += 1
+        if days is not None and row[days] < 0:
+            expired += 1
+    more["count"] = more.get("count", 0) + len(dropped)
+    if by_category:
+        more["by_category"] = dict(by_category)
+    if expired:
+        more["expired"] = expired
+    trimmed = dict(output)
+    trimmed["items"] = kept
+    trimmed["more"] = more
+    return trimmed
+
+
+def is_records(output) -> bool:
+    return isinstance(output, dict) and "fields" in output and isinstance(output.get("items"), list)
+
+
+# ------------------------------------------------
+# 🖨️ Local rendering
+# ------------------------------------------------
+def _when(days_left: int) -> str:
+    if days_left < -1:
+        return f"expired {-days_left} days ago"
+    if days_left == -1:
+        return "expired yesterday"
+    if days_left == 0:
+        return "expires today"
+    if days_left == 1:
+        return "expires tomorrow"
+    return f"expires in {days_left} days"
+
+
+def render_records(output: dict) -> list[str]:
+    """Display lines for a structured tool output, without an LLM"""
+    if output.get("message"):
+        return [output["message"]]
+    fields = output["fields"]
+    lines = []
+    for row in output["items"]:
+        r = dict(zip(fields, row))
+        name = f"{r['name']} x{r['quantity']}" if r.get("quantity", 1) != 1 else r["name"]
+        lines.append(f"• {name} ({r['category']}) — {_when(r['days_left'])} ({r['expiry_date']})")
+    more = output.get("more")
+    if more:
+        detail = ", ".join(f"{c} {n}" for c, n in sorted(more.get("by_category", {}).items()))
+        lines.append(f"…and {more['count']} more" + (f" ({detail})" if detail else ""))
+    return lines
+
+
+def render_tool_output(output) -> list[str]:
+    """Display lines for any tool's output"""
+    if is_records(output):
+        return render_records(output)
+    if isinstance(output, dict):
+        for key in ("status", "error", "message"):
+            if key in output:
+                return [str(output[key])]
+    return [str(output)]
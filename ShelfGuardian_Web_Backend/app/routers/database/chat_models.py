@@ -1,35 +1,3 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Enum
-from sqlalchemy.orm import relationship
-from .db import Base
-import enum
-
-
-class ProductCategory(str, enum.Enum):
-    FOOD = "FOOD"
-    MEDICINE = "MEDICINE"
-    MISCELLANEOUS = "MISCELLANEOUS"
-
-
-class User(Base):
-    __tablename__ = "users"
-
-    id = Column(Integer, primary_key=True, index=True)
-    email = Column(String, nullable=False, unique=True, index=True)
-    username = Column(String, nullable=False, unique=True, index=True)
-    hashed_password = Column(String, nullable=False)
-
-    products = relationship("Product", back_populates="user")
-
-
-class Product(Base):
-    __tablename__ = "products"
-
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(100), nullable=False)
-    category = Column(Enum(ProductCategory, name="productcategory"), nullable=False)
-    expiry_date = Column(Date, nullable=False)
-    quantity = Column(Integer, nullable=False, default=1)
-    description = Column(String, nullable=True)
-
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    user = relationship("User", back_populates="products")
+# The chatbot uses the application's models, so both sides agree on one
+# schema and one enum (stored by name: FOOD, MEDICINE, MISCELLANEOUS).
+from app.models import Product, ProductCategory, User  # noqa: F401
@@ -0,0 +1,64 @@
+import asyncio
+import os
+import orjson
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect, status
+from app.auth import get_user_from_token
+from app.database import SessionLocal
+from app.services.events import ACCOUNT_DELETED, event_hub
+
+router = APIRouter()
+
+# Idle connections get a ping this often so proxies don't close them
+EVENTS_PING_SECONDS = float(os.getenv("EVENTS_PING_SECONDS", "30"))
+
+
+async def _wait_closed(websocket: WebSocket):
+    # Clients don't send anything; reading just notices the disconnect promptly
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+
+
+@router.websocket("/ws")
+async def product_events(websocket: WebSocket, token: str = Query(...)):
+    """Push the current user's product events (created, updated, deleted, expiring, expired).
+
+    Browsers can't set headers on WebSocket requests, so the access token is
+    passed as the `token` query parameter.
+    """
+    db = SessionLocal()
+    try:
+        user = get_user_from_token(db, token)
+    finally:
+        db.close()
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    queue = event_hub.subscribe(user.id)
+    closed = asyncio.create_task(_wait_closed(websocket))
+    try:
+        while not closed.done():
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {getter, closed}, timeout=EVENTS_PING_SECONDS, return_when=asyncio.FIRST_COMPLETED
+            )
+            if getter in done:
+                event = getter.result()
+            else:
+                getter.cancel()
+                if closed.done():
+                    break
+                event = {"type": "ping"}
+            await websocket.send_text(orjson.dumps(event).decode())
+            if event["type"] == ACCOUNT_DELETED:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        closed.cancel()
+        event_hub.unsubscribe(user.id, queue)
@@ -1,51 +1,271 @@
 from datetime import date, timedelta
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status, Query
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import case, delete, literal, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.database import get_db, get_read_db, mark_user_write
 from app.models import Product, ProductCategory, User
-from app.schemas import ProductCreate, ProductResponse, ProductUpdate
-from app.auth import get_current_user  # ✅ Import your auth dependency
+from app.schemas import (
+    ProductCreate, ProductResponse, ProductUpdate,
+    ProductIds, ProductBatchUpdate, ProductBatchResponse, ProductSyncResponse, ProductImport,
+)
+from app.auth import get_current_user, get_user_read_db  # ✅ Import your auth dependency
+from app.serialization import PRODUCT_COLUMNS, product_rows_response, product_rows_to_dicts, product_to_dict
+from app.merge import insert_products, is_merge_conflict, merging
+from app.search import search_products
+from app.sync import SYNC_PAGE_SIZE, changes_since, record_deletions
+from app.services.events import publish_deleted, publish_products
+from app.services.idempotency import REPLAY_HEADER, fingerprint, idempotency_store
+from app.services.inventory_cache import get_user_products, inventory_cache
 
 router = APIRouter()
 
 @router.post("/", response_model=ProductResponse, status_code=status.HTTP_201_CREATED)
-async def create_product(
+def create_product(
     product: ProductCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)  # ✅ Authenticated user
 ):
-    """Create a new product with authenticated user"""
+    """Create a new product with authenticated user.
+
+    With PRODUCT_MERGE_DUPLICATES on, a product matching an existing one
+    (name ignoring case, category, expiry date) is added to its quantity
+    instead, and that product is returned with a new version.
+
+    Retries sending the same `Idempotency-Key` get the first response back
+    instead of creating another product.
+    """
+    if not idempotency_key:
+        return _create_product(product, db, current_user)
+
+    created, replayed = idempotency_store.run(
+        "products.create", current_user.id, idempotency_key,
+        fingerprint(product.model_dump(mode="json")),
+        lambda: _create_product(product, db, current_user),
+    )
+    if replayed:
+        response.headers[REPLAY_HEADER] = "true"
+    return created
+
+
+def _create_product(product: ProductCreate, db: Session, current_user: User) -> dict:
+    if merging(db.get_bind().dialect.name):
+        return _insert_products(db, current_user.id, [product])[0]
+
     db_product = Product(**product.model_dump())
     db_product.user_id = current_user.id  # ✅ Proper foreign key reference
 
     db.add(db_product)
+    mark_user_write(current_user.id)
     db.commit()
+    inventory_cache.invalidate(current_user.id)
     db.refresh(db_product)
-    return db_product
+    publish_products(current_user.id, "created", [db_product])
+    return product_to_dict(db_product)
+
+
+def _insert_products(db: Session, user_id: int, products: List[ProductCreate]) -> list:
+    rows = [{**p.model_dump(), "user_id": user_id} for p in products]
+    stmt = insert_products(db.get_bind().dialect.name, rows)
+    saved = product_rows_to_dicts(db.execute(stmt).all())
+    mark_user_write(user_id)
+    db.commit()
+    inventory_cache.invalidate(user_id)
+    publish_products(user_id, "created", [p for p in saved if p["version"] == 1])
+    publish_products(user_id, "updated", [p for p in saved if p["version"] > 1])
+    return saved
+
+
+@router.post("/import", response_model=List[ProductResponse], status_code=status.HTTP_201_CREATED,
+             response_class=ORJSONResponse)
+def import_products(
+    body: ProductImport,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Add many products in a single INSERT; merges duplicates like POST / does.
+
+    Returns one product per distinct item saved; merged products have a
+    version above 1. Retries sending the same `Idempotency-Key` get the first
+    response back instead of adding everything again.
+    """
+    if not idempotency_key:
+        saved = _insert_products(db, current_user.id, body.products)
+        return ORJSONResponse(content=saved, status_code=status.HTTP_201_CREATED)
 
+    saved, replayed = idempotency_store.run(
+        "products.import", current_user.id, idempotency_key,
+        fingerprint(body.model_dump(mode="json")),
+        lambda: _insert_products(db, current_user.id, body.products),
+    )
+    response = ORJSONResponse(content=saved, status_code=status.HTTP_201_CREATED)
+    if replayed:
+        response.headers[REPLAY_HEADER] = "true"
+    return response
 
-@router.get("/", response_model=List[ProductResponse])
+
+def _check_merge_conflict(db: Session, error: IntegrityError):
+    """Roll back; a collision on the merge key (PRODUCT_MERGE_DUPLICATES) becomes a 409"""
+    db.rollback()
+    if is_merge_conflict(db, error):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A product with this name, category and expiry date already exists",
+        )
+
+
+@router.get("/", response_model=List[ProductResponse], response_class=ORJSONResponse)
 async def get_products(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
     category: Optional[ProductCategory] = Query(None),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """Get all products (no auth) + optional category filter"""
-    query = db.query(Product)
+    query = db.query(*PRODUCT_COLUMNS)
 
     if category:
         query = query.filter(Product.category == category)
 
-    return query.offset(skip).limit(limit).all()
+    return product_rows_response(query.offset(skip).limit(limit).all())
+
+
+@router.get("/search", response_model=List[ProductResponse], response_class=ORJSONResponse)
+def search_my_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_user_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Fuzzy/prefix search of the current user's products by name, best match first"""
+    return product_rows_response(search_products(db, current_user.id, q, limit))
+
+
+@router.get("/sync", response_model=ProductSyncResponse, response_class=ORJSONResponse)
+def sync_my_products(
+    cursor: Optional[str] = Query(None, max_length=200),
+    limit: int = Query(SYNC_PAGE_SIZE, ge=1, le=SYNC_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Products created, changed or deleted since `cursor` (omit it for a full sync).
+
+    Store the returned cursor and send it next time; keep calling while
+    `has_more` is true. Reads the primary: a lagging replica could hand out
+    a cursor past rows it hasn't received yet.
+    """
+    try:
+        changes = changes_since(db, current_user.id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return ORJSONResponse(content=changes)
+
+
+# ---------------------------- BATCH ----------------------------------
+
+def _batch_results(db: Session, ids: List[int], user_id: int, done: dict, ok_status: str):
+    """Per-id results in request order; ids missing from `done` are classified with one lookup"""
+    missing = [i for i in ids if i not in done]
+    owners = dict(db.execute(select(Product.id, Product.user_id).where(Product.id.in_(missing))).all()) if missing else {}
+    results = []
+    for i in ids:
+        if i in done:
+            results.append({"id": i, "status": ok_status, "product": done[i]})
+        elif i in owners and owners[i] != user_id:
+            results.append({"id": i, "status": "forbidden", "product": None})
+        else:
+            results.append({"id": i, "status": "not_found", "product": None})
+    return ORJSONResponse(content={"results": results})
+
+
+@router.post("/batch/get", response_model=ProductBatchResponse, response_class=ORJSONResponse)
+def get_products_batch(
+    body: ProductIds,
+    db: Session = Depends(get_user_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Fetch many of the current user's products by id in one query"""
+    ids = list(dict.fromkeys(body.ids))
+    rows = db.execute(
+        select(*PRODUCT_COLUMNS).where(Product.id.in_(ids), Product.user_id == current_user.id)
+    ).all()
+    found = {p["id"]: p for p in product_rows_to_dicts(rows)}
+    return _batch_results(db, ids, current_user.id, found, "ok")
+
+
+@router.patch("/batch", response_model=ProductBatchResponse, response_class=ORJSONResponse)
+def update_products_batch(
+    body: ProductBatchUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Update many products in a single UPDATE; each item only changes the fields it sets"""
+    changes = {item.id: item.model_dump(exclude_unset=True, exclude={"id"}) for item in body.items}
+    if len(changes) != len(body.items):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Duplicate product ids in batch")
+    ids = list(changes)
+
+    # One CASE per touched column: SET name = CASE id WHEN 1 THEN ... ELSE name END
+    values = {}
+    for field in {f for fields in changes.values() for f in fields}:
+        column = Product.__table__.c[field]
+        whens = {i: literal(fields[field], column.type) for i, fields in changes.items() if field in fields}
+        values[field] = case(whens, value=Product.id, else_=column)
+    if values:
+        values["version"] = Product.version + 1  # updated_at is set by its onupdate
+
+    owned = (Product.id.in_(ids), Product.user_id == current_user.id)
+    if values:
+        stmt = update(Product).where(*owned).values(values).returning(*PRODUCT_COLUMNS)
+        try:
+            rows = db.execute(stmt, execution_options={"synchronize_session": False}).all()
+        except IntegrityError as e:
+            _check_merge_conflict(db, e)
+            raise
+    else:
+        rows = db.execute(select(*PRODUCT_COLUMNS).where(*owned)).all()
+    updated = {p["id"]: p for p in product_rows_to_dicts(rows)}
+
+    mark_user_write(current_user.id)
+    db.commit()
+    inventory_cache.invalidate(current_user.id)
+    publish_products(current_user.id, "updated", updated.values())
+    return _batch_results(db, ids, current_user.id, updated, "ok")
+
+
+@router.post("/batch/delete", response_model=ProductBatchResponse, response_class=ORJSONResponse)
+def delete_products_batch(
+    body: ProductIds,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Delete many of the current user's products in a single DELETE"""
+    ids = list(dict.fromkeys(body.ids))
+    stmt = (
+        delete(Product)
+        .where(Product.id.in_(ids), Product.user_id == current_user.id)
+        .returning(Product.id)
+    )
+    deleted = {row[0]: None for row in db.execute(stmt, execution_options={"synchronize_session": False})}
+    record_deletions(db, current_user.id, deleted)
+
+    mark_user_write(current_user.id)
+    db.commit()
+    inventory_cache.invalidate(current_user.id)
+    publish_deleted(current_user.id, deleted)
+    return _batch_results(db, ids, current_user.id, deleted, "deleted")
 
 
 @router.get("/{product_id}", response_model=ProductResponse)
 async def get_product(
     product_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """Get product by ID (no auth)"""
     product = db.query(Product).filter(Product.id == product_id).first()
@@ -55,10 +275,10 @@ async def get_product(
 
     return product
 
-@router.get("/user/{user_id}")
+@router.get("/user/{user_id}", response_model=List[ProductResponse], response_class=ORJSONResponse)
 def get_products_by_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_user_read_db),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.id != user_id:
@@ -67,11 +287,10 @@ def get_products_by_user(
             detail="Not allowed to view other users' products"
         )
 
-    products = db.query(Product).filter(Product.user_id == user_id).all()
-    return products
+    return product_rows_response(get_user_products(db, user_id))
 
 @router.put("/{product_id}", response_model=ProductResponse)
-async def update_product(
+def update_product(
     product_id: int,
     product_update: ProductUpdate,
     db: Session = Depends(get_db),
@@ -89,14 +308,22 @@ async def update_product(
 
     for field, value in product_update.model_dump(exclude_unset=True).items():
         setattr(product, field, value)
+    product.version = Product.version + 1
 
-    db.commit()
+    mark_user_write(product.user_id)
+    try:
+        db.commit()
+    except IntegrityError as e:
+        _check_merge_conflict(db, e)
+        raise
     db.refresh(product)
+    inventory_cache.invalidate(product.user_id)
+    publish_products(product.user_id, "updated", [product])
     return product
 
 
 @router.delete("/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_product(
+def delete_product(
     product_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -111,28 +338,34 @@ async def delete_product(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed")
 
     db.delete(product)
+    record_deletions(db, product.user_id, [product_id])
+    mark_user_write(product.user_id)
     db.commit()
+    inventory_cache.invalidate(product.user_id)
+    publish_deleted(product.user_id, [product_id])
 
 
-@router.get("/category/{category}", response_model=List[ProductResponse])
+@router.get("/category/{category}", response_model=List[ProductResponse], response_class=ORJSONResponse)
 async def get_products_by_category(
     category: ProductCategory,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """Get products by category (no auth)"""
-    return db.query(Product).filter(Product.category == category).all()
+    products = db.query(*PRODUCT_COLUMNS).filter(Product.category == category).all()
+    return product_rows_response(products)
 
 
-@router.get("/expiring/soon", response_model=List[ProductResponse])
+@router.get("/expiring/soon", response_model=List[ProductResponse], response_class=ORJSONResponse)
 async def get_expiring_products(
     days: int = Query(7, ge=1),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """Get products expiring within X days (no auth)"""
     today = date.today()
     expiry_date = today + timedelta(days=days)
 
-    return db.query(Product).filter(
+    products = db.query(*PRODUCT_COLUMNS).filter(
         Product.expiry_date >= today,
         Product.expiry_date <= expiry_date
     ).order_by(Product.expiry_date).all()
+    return product_rows_response(products)
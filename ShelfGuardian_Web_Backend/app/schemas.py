@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr, ConfigDict
-from datetime import date
-from typing import Optional
+from pydantic import BaseModel, EmailStr, ConfigDict, Field, field_validator
+from datetime import date, datetime
+from typing import List, Optional
 from app.models import ProductCategory
 
 
@@ -50,10 +50,59 @@ class ProductUpdate(BaseModel):
     quantity: Optional[int] = None
     description: Optional[str] = None
 
+    @field_validator("name", "category", "expiry_date")
+    @classmethod
+    def not_null(cls, value):
+        # Optional so they can be left out, but the columns are NOT NULL
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
+
 
 class ProductResponse(ProductBase):
     id: int
     user_id: int
+    version: int
+    updated_at: datetime
     
     model_config = ConfigDict(from_attributes=True)
 
+
+
+# Batch Schemas
+MAX_BATCH_SIZE = 500
+
+
+class ProductIds(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class ProductImport(BaseModel):
+    products: List[ProductCreate] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class ProductBatchUpdateItem(ProductUpdate):
+    id: int
+
+
+class ProductBatchUpdate(BaseModel):
+    items: List[ProductBatchUpdateItem] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class ProductBatchResult(BaseModel):
+    id: int
+    status: str  # "ok", "deleted", "not_found" or "forbidden"
+    product: Optional[ProductResponse] = None
+
+
+class ProductBatchResponse(BaseModel):
+    results: List[ProductBatchResult]
+
+
+# Sync Schemas
+class ProductSyncResponse(BaseModel):
+    changed: List[ProductResponse]
+    deleted: List[int]
+    cursor: str
+    has_more: bool
+    reset: bool
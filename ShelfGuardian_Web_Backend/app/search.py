@@ -0,0 +1,145 @@
+"""Ranked product-name search scoped to one user.
+
+PostgreSQL uses a pg_trgm GIN index (fuzzy word similarity, so typos and
+partial words still match); SQLite uses an FTS5 index with prefix matching.
+Anything else, or a PostgreSQL without pg_trgm, falls back to a substring LIKE.
+"""
+import logging
+import re
+from typing import List
+from sqlalchemy import case, column, func, literal, select, table, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from app.models import Product
+from app.serialization import PRODUCT_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_fts = table("products_fts", column("rowid"))
+
+# Whether the trigram index could be set up; checked lazily per process
+_trigram_available = None
+
+
+def _has_trigram(db: Session) -> bool:
+    global _trigram_available
+    if _trigram_available is None:
+        _trigram_available = db.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        ).first() is not None
+    return _trigram_available
+
+
+def setup_search_index(engine: Engine):
+    """Create the name search index for the current backend (idempotent)."""
+    global _trigram_available
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_products_name_trgm "
+                    "ON products USING gin (lower(name) gin_trgm_ops)"
+                ))
+            _trigram_available = True
+        except Exception as e:
+            logger.warning("pg_trgm unavailable, product search falls back to LIKE: %s", e)
+            _trigram_available = False
+    elif dialect == "sqlite":
+        with engine.begin() as conn:
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+            )).first()
+            if exists:
+                return
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE products_fts USING fts5("
+                "name, content='products', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER products_fts_ai AFTER INSERT ON products BEGIN "
+                "INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name); END"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER products_fts_ad AFTER DELETE ON products BEGIN "
+                "INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name); END"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER products_fts_au AFTER UPDATE OF name ON products BEGIN "
+                "INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+                "INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name); END"
+            ))
+            conn.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+
+
+def _like_search(db: Session, user_id: int, tokens: List[str], limit: int) -> List[tuple]:
+    name = func.lower(Product.name)
+    query = " ".join(tokens).lower()
+    stmt = (
+        select(*PRODUCT_COLUMNS)
+        .where(
+            Product.user_id == user_id,
+            *(name.contains(t.lower(), autoescape=True) for t in tokens),
+        )
+        .order_by(
+            case((name.startswith(query, autoescape=True), 0), else_=1),
+            func.length(Product.name),
+            Product.expiry_date,
+        )
+        .limit(limit)
+    )
+    return db.execute(stmt).all()
+
+
+def _trigram_search(db: Session, user_id: int, q: str, limit: int) -> List[tuple]:
+    name = func.lower(Product.name)
+    query = q.lower()
+    # `<%` is word similarity: "milk" matches "Amul Taaza Milk" and "mlik" still scores
+    stmt = (
+        select(*PRODUCT_COLUMNS)
+        .where(Product.user_id == user_id, literal(query).op("<%", is_comparison=True)(name))
+        .order_by(
+            case((name.startswith(query, autoescape=True), 0), else_=1),
+            func.word_similarity(query, name).desc(),
+            Product.expiry_date,
+        )
+        .limit(limit)
+    )
+    return db.execute(stmt).all()
+
+
+def _fts_search(db: Session, user_id: int, tokens: List[str], limit: int) -> List[tuple]:
+    # Every token must match as a word prefix: "cow mi" -> "cow"* "mi"*
+    match = " ".join('"{}"*'.format(t.replace('"', '""')) for t in tokens)
+    stmt = (
+        select(*PRODUCT_COLUMNS)
+        .join(_fts, _fts.c.rowid == Product.id)
+        .where(text("products_fts MATCH :match"), Product.user_id == user_id)
+        .order_by(text("bm25(products_fts)"), Product.expiry_date)
+        .limit(limit)
+    )
+    return db.execute(stmt, {"match": match}).all()
+
+
+def search_products(db: Session, user_id: int, q: str, limit: int = 20) -> List[tuple]:
+    """Best matches for `q` among `user_id`'s products, as rows in PRODUCT_COLUMNS order."""
+    tokens = _TOKEN.findall(q or "")
+    if not tokens:
+        return []
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql" and _has_trigram(db):
+        return _trigram_search(db, user_id, " ".join(tokens), limit)
+    if dialect == "sqlite":
+        try:
+            rows = _fts_search(db, user_id, tokens, limit)
+        except Exception as e:  # FTS table missing (setup not run) or FTS5 not compiled in
+            logger.warning("FTS product search failed, falling back to LIKE: %s", e)
+            db.rollback()
+            rows = []
+        if rows:
+            return rows
+    return _like_search(db, user_id, tokens, limit)
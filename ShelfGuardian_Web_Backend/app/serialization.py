@@ -0,0 +1,40 @@
+from typing import Iterable, Sequence
+from fastapi.responses import ORJSONResponse
+from app.models import Product
+
+# Columns returned by the product list endpoints, in ProductResponse field order.
+# Selecting these directly yields plain row tuples instead of ORM instances,
+# which skips identity-map bookkeeping and per-row pydantic validation.
+PRODUCT_COLUMNS = (
+    Product.id,
+    Product.name,
+    Product.category,
+    Product.expiry_date,
+    Product.quantity,
+    Product.description,
+    Product.user_id,
+    Product.version,
+    Product.updated_at,
+)
+
+PRODUCT_FIELDS = tuple(column.key for column in PRODUCT_COLUMNS)
+
+
+def product_rows_to_dicts(rows: Iterable[Sequence]) -> list:
+    """Map product row tuples (in PRODUCT_COLUMNS order) to plain dicts"""
+    fields = PRODUCT_FIELDS
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def product_to_dict(product) -> dict:
+    """Plain dict of a Product instance, shaped like ProductResponse"""
+    return {field: getattr(product, field) for field in PRODUCT_FIELDS}
+
+
+def product_rows_response(rows: Iterable[Sequence], status_code: int = 200) -> ORJSONResponse:
+    """Serialize product row tuples straight to JSON bytes with orjson.
+
+    orjson encodes dates and str enums natively, so the rows never go through
+    ProductResponse or jsonable_encoder.
+    """
+    return ORJSONResponse(content=product_rows_to_dicts(rows), status_code=status_code)
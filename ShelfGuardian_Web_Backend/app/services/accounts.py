@@ -0,0 +1,34 @@
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+from app.models import ArchivedProduct, Product, ProductTombstone, User
+from app.services.chat_service import reset_history
+from app.services.events import ACCOUNT_DELETED, event_hub
+from app.services.idempotency import idempotency_store
+from app.services.inventory_cache import inventory_cache
+
+
+def delete_account(db: Session, user_id: int) -> int:
+    """Delete a user and all their rows in one transaction; returns how many products went.
+
+    Every table is cleared with a single set-based DELETE, so nothing is
+    loaded into the session however large the account. products.user_id
+    cascades on delete, but databases created before it did still have a
+    plain foreign key, so products are deleted explicitly first.
+    """
+    options = {"synchronize_session": False}
+    removed = db.execute(delete(Product).where(Product.user_id == user_id), execution_options=options).rowcount
+    db.execute(delete(ArchivedProduct).where(ArchivedProduct.user_id == user_id), execution_options=options)
+    db.execute(delete(ProductTombstone).where(ProductTombstone.user_id == user_id), execution_options=options)
+    db.execute(delete(User).where(User.id == user_id), execution_options=options)
+    db.commit()
+    forget_user(user_id)
+    return removed
+
+
+def forget_user(user_id: int):
+    """Drop everything this process keeps in memory for a deleted user"""
+    inventory_cache.invalidate(user_id)
+    reset_history(str(user_id))
+    idempotency_store.forget_owner(user_id)
+    # Open event connections are closed by the WebSocket handler on this event
+    event_hub.publish(user_id, {"type": ACCOUNT_DELETED})
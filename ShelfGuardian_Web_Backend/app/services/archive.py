@@ -0,0 +1,97 @@
+import logging
+import os
+from datetime import date, timedelta
+from sqlalchemy import delete, insert, inspect, literal, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from app.models import ArchivedProduct, Product
+from app.partitioning import drop_partitions_before
+from app.sync import tombstone_partition, tombstones_from_select
+
+logger = logging.getLogger(__name__)
+
+# Expired products are moved to products_archive rather than deleted, keeping
+# the hot products table (and its indexes) small while preserving waste history.
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "7"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+# 0 keeps archived rows forever
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "730"))
+
+_ARCHIVE_COLUMNS = ["product_id", "name", "category", "expiry_date", "quantity", "user_id", "archived_at"]
+
+
+def _archive_partition(conn: Connection, partition: str):
+    """Copy a whole expired partition into the archive before it is dropped"""
+    conn.execute(text(
+        f"INSERT INTO {ArchivedProduct.__tablename__} ({', '.join(_ARCHIVE_COLUMNS)}) "
+        f"SELECT id, name, category, expiry_date, quantity, user_id, :today FROM {partition}"
+    ), {"today": date.today()})
+    tombstone_partition(conn, partition)
+
+
+def archive_expired_products(db: Session, threshold: date, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Move products that expired before `threshold` into the archive.
+
+    Whole expired months are archived and dropped per partition when the table
+    is partitioned; the remaining rows move in batches of `batch_size`, one
+    short transaction per batch so locks are held briefly.
+    """
+    moved = drop_partitions_before(db.get_bind(), threshold, before_drop=_archive_partition) or 0
+
+    today = date.today()
+    while True:
+        ids = [
+            row[0] for row in
+            db.query(Product.id)
+            .filter(Product.expiry_date < threshold)
+            .order_by(Product.id)
+            .limit(batch_size)
+        ]
+        if not ids:
+            break
+        # expiry_date is repeated so partitioned tables prune to the expired months
+        batch = (Product.id.in_(ids), Product.expiry_date < threshold)
+        db.execute(insert(ArchivedProduct).from_select(
+            _ARCHIVE_COLUMNS,
+            select(
+                Product.id, Product.name, Product.category, Product.expiry_date,
+                Product.quantity, Product.user_id, literal(today),
+            ).where(*batch),
+        ))
+        db.execute(tombstones_from_select(batch))
+        db.execute(delete(Product).where(*batch), execution_options={"synchronize_session": False})
+        db.commit()
+        moved += len(ids)
+    return moved
+
+
+def purge_archive(db: Session, retention_days: int = ARCHIVE_RETENTION_DAYS) -> int:
+    """Delete archived rows older than the archive's own retention window"""
+    if retention_days <= 0:
+        return 0
+    cutoff = date.today() - timedelta(days=retention_days)
+    result = db.execute(delete(ArchivedProduct).where(ArchivedProduct.archived_at < cutoff))
+    db.commit()
+    return result.rowcount
+
+
+def setup_archive_columns(engine: Engine):
+    """Give an archive created before `product_id` existed its own ids (idempotent).
+
+    Those archives used the product's id as their primary key; it becomes the
+    row's `product_id`, and new rows get ids from the table's own sequence.
+    """
+    table = ArchivedProduct.__tablename__
+    if "product_id" in {c["name"] for c in inspect(engine).get_columns(table)}:
+        return
+    logger.info("Adding product_id to %s", table)
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN product_id INTEGER NOT NULL DEFAULT 0"))
+        conn.execute(text(f"UPDATE {table} SET product_id = id"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_product_id ON {table} (product_id)"))
+        if engine.dialect.name == "postgresql":
+            # Ids were always given explicitly, so the sequence never advanced
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT coalesce(max(id), 0) + 1 FROM {table}), false)"
+            ))
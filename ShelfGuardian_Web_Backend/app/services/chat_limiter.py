@@ -0,0 +1,109 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from fastapi import HTTPException, status
+
+# Admission control for the chatbot. Chats wait on Gemini on the event loop
+# rather than holding a thread, so the concurrency cap protects the model
+# quota and database pool; we also cap how often a single user may ask, and
+# shed everything beyond the queue with a fast 429.
+CHAT_RATE_PER_MINUTE = float(os.getenv("CHAT_RATE_PER_MINUTE", "10"))
+CHAT_BURST = int(os.getenv("CHAT_BURST", "3"))
+CHAT_MAX_CONCURRENT = int(os.getenv("CHAT_MAX_CONCURRENT", "100"))
+CHAT_MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", "200"))
+CHAT_QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", "10"))
+
+
+class TokenBucket:
+    """Classic token bucket: `capacity` tokens, refilled at `rate` tokens per second"""
+
+    def __init__(self, capacity: int, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """Take one token. Returns 0 on success, else seconds until one is available."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class ChatLimiter:
+    """Per-user token bucket plus a global bounded queue in front of the chat slots"""
+
+    def __init__(
+        self,
+        rate_per_minute: float = CHAT_RATE_PER_MINUTE,
+        burst: int = CHAT_BURST,
+        max_concurrent: int = CHAT_MAX_CONCURRENT,
+        max_queue: int = CHAT_MAX_QUEUE,
+        queue_timeout: float = CHAT_QUEUE_TIMEOUT,
+    ):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = None  # asyncio.Semaphore, created on the serving loop
+        self._buckets: dict = {}
+        self._lock = threading.Lock()
+        self._waiting = 0
+
+    def _reject(self, detail: str, retry_after: float):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    def _check_rate(self, user_id: str):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = self._buckets[user_id] = TokenBucket(self.burst, self.rate)
+            wait = bucket.take(now)
+            # Drop buckets that have refilled completely; they carry no state.
+            if len(self._buckets) > 10_000:
+                self._buckets = {
+                    uid: b for uid, b in self._buckets.items()
+                    if b.tokens + (now - b.updated) * b.rate < b.capacity
+                }
+        if wait:
+            self._reject("Too many chat requests, please slow down", wait)
+
+    @asynccontextmanager
+    async def slot(self, user_id: str):
+        """Admit one chat request for `user_id` or raise HTTP 429"""
+        self._check_rate(user_id)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+
+        if self._slots.locked():
+            if self._waiting >= self.max_queue:
+                self._reject("Chatbot is busy, please retry shortly", self.queue_timeout)
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._reject("Chatbot is busy, please retry shortly", self.queue_timeout)
+            finally:
+                self._waiting -= 1
+        else:
+            await self._slots.acquire()
+
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+
+chat_limiter = ChatLimiter()
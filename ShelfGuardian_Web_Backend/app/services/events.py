@@ -0,0 +1,142 @@
+"""Per-user product events pushed to WebSocket clients.
+
+Subscribers live in this worker process, so a client sees the writes handled
+by the worker it is connected to plus the scheduler's daily expiry events.
+Clients should refetch after connecting, and on a `resync` event, which is
+sent when their queue overflowed or many products changed at once.
+"""
+import asyncio
+import os
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Iterable
+from sqlalchemy.orm import Session
+from app.models import Product
+from app.serialization import PRODUCT_COLUMNS, product_rows_to_dicts, product_to_dict
+
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+# Same default window as GET /api/products/expiring/soon
+EXPIRY_WARNING_DAYS = int(os.getenv("EXPIRY_WARNING_DAYS", "7"))
+
+# Last event on a connection: the user's account was deleted
+ACCOUNT_DELETED = "account.deleted"
+
+
+class EventHub:
+    """Fan-out of events to each user's open connections.
+
+    `publish` may be called from any thread (sync routes run in a threadpool,
+    the scheduler in its own thread); delivery always happens on the event
+    loop that owns the subscriber queues.
+    """
+
+    def __init__(self, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)  # user_id -> set of asyncio.Queue
+        self._loop = None
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        with self._lock:
+            queues = self._subscribers.get(user_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_id]
+
+    def connected_users(self) -> set:
+        with self._lock:
+            return set(self._subscribers)
+
+    def publish(self, user_id: int, event: dict):
+        with self._lock:
+            queues = list(self._subscribers.get(user_id, ()))
+        if queues:
+            self._dispatch(queues, event)
+
+    def broadcast(self, event: dict):
+        with self._lock:
+            queues = [q for qs in self._subscribers.values() for q in qs]
+        if queues:
+            self._dispatch(queues, event)
+
+    def _dispatch(self, queues: list, event: dict):
+        loop = self._loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(queues, event)
+            return
+        try:
+            loop.call_soon_threadsafe(self._deliver, queues, event)
+        except RuntimeError:  # loop closed during shutdown
+            pass
+
+    @staticmethod
+    def _deliver(queues: list, event: dict):
+        for queue in queues:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Client can't keep up: drop its backlog and have it refetch
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self._subscribers),
+                "connections": sum(len(qs) for qs in self._subscribers.values()),
+            }
+
+
+event_hub = EventHub()
+
+
+def publish_products(user_id: int, kind: str, products: Iterable):
+    """Publish `product.<kind>` for Product instances or product dicts"""
+    for product in products:
+        if not isinstance(product, dict):
+            product = product_to_dict(product)
+        event_hub.publish(user_id, {"type": f"product.{kind}", "product": product})
+
+
+def publish_deleted(user_id: int, ids: Iterable[int]):
+    for product_id in ids:
+        event_hub.publish(user_id, {"type": "product.deleted", "id": product_id})
+
+
+def publish_expiry_thresholds(db: Session, today: date = None) -> int:
+    """Scheduled job: tell connected users about products that crossed a threshold today.
+
+    A product enters the warning window when it is EXPIRY_WARNING_DAYS from
+    expiry and expires the day after its expiry date. Only connected users are
+    queried. Returns the number of events published.
+    """
+    users = event_hub.connected_users()
+    if not users:
+        return 0
+    today = today or date.today()
+    warn_on, expired_on = today + timedelta(days=EXPIRY_WARNING_DAYS), today - timedelta(days=1)
+    rows = db.query(*PRODUCT_COLUMNS).filter(
+        Product.user_id.in_(users),
+        Product.expiry_date.in_([warn_on, expired_on]),
+    ).all()
+    for product in product_rows_to_dicts(rows):
+        if product["expiry_date"] == warn_on:
+            event = {"type": "product.expiring", "days_left": EXPIRY_WARNING_DAYS, "product": product}
+        else:
+            event = {"type": "product.expired", "product": product}
+        event_hub.publish(product["user_id"], event)
+    return len(rows)
@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional, Tuple
+from fastapi import HTTPException, status
+
+# Responses to requests carrying an Idempotency-Key are kept this long and
+# replayed to retries instead of running the request again.
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+def fingerprint(payload: Any) -> str:
+    """Stable hash of a request body, to tell a retry from a different request reusing the key"""
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.created = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.future = None  # set by arun: async waiters await it instead of `done`
+
+
+class IdempotencyStore:
+    """First result per (scope, owner, key), kept for `ttl` seconds.
+
+    A retry that arrives while the first request is still running waits for
+    it and gets the same result. Failures (exceptions, or results rejected by
+    `keep`) are not stored, so the client's next retry runs again.
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, max_keys: int = IDEMPOTENCY_MAX_KEYS):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()  # insertion order == expiry order
+        self.replays = 0
+
+    def _claim(self, scope: str, owner: Hashable, key: str, request_fingerprint: str):
+        """(entry key, entry, whether this caller runs the request)"""
+        entry_key = (scope, str(owner), key)
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(entry_key)
+            leader = entry is None
+            if leader:
+                entry = self._entries[entry_key] = _Entry(request_fingerprint)
+                while len(self._entries) > self.max_keys:
+                    self._entries.popitem(last=False)
+
+        if entry.fingerprint != request_fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used for a different request",
+            )
+        return entry_key, entry, leader
+
+    def run(
+        self,
+        scope: str,
+        owner: Hashable,
+        key: str,
+        request_fingerprint: str,
+        fn: Callable[[], Any],
+        keep: Optional[Callable[[Any], bool]] = None,
+    ) -> Tuple[Any, bool]:
+        """Run `fn` once for this key. Returns (result, replayed)."""
+        entry_key, entry, leader = self._claim(scope, owner, key, request_fingerprint)
+
+        if not leader:
+            entry.done.wait()
+            if entry.error is not None:
+                raise entry.error
+            with self._lock:
+                self.replays += 1
+            return entry.result, True
+
+        try:
+            entry.result = fn()
+        except BaseException as e:
+            entry.error = e
+            self._discard(entry_key, entry)
+            raise
+        finally:
+            entry.done.set()
+        if keep is not None and not keep(entry.result):
+            self._discard(entry_key, entry)
+        return entry.result, False
+
+    async def arun(
+        self,
+        scope: str,
+        owner: Hashable,
+        key: str,
+        request_fingerprint: str,
+        fn: Callable[[], Awaitable[Any]],
+        keep: Optional[Callable[[Any], bool]] = None,
+    ) -> Tuple[Any, bool]:
+        """`run` for coroutines, waiting on the event loop instead of blocking a thread"""
+        entry_key, entry, leader = self._claim(scope, owner, key, request_fingerprint)
+        if leader:
+            entry.future = asyncio.get_running_loop().create_future()
+
+        if not leader:
+            if entry.future is not None:
+                await asyncio.shield(entry.future)
+            else:
+                await asyncio.to_thread(entry.done.wait)
+            if entry.error is not None:
+                raise entry.error
+            with self._lock:
+                self.replays += 1
+            return entry.result, True
+
+        try:
+            entry.result = await fn()
+        except BaseException as e:
+            entry.error = e
+            self._discard(entry_key, entry)
+            raise
+        finally:
+            entry.done.set()
+            entry.future.set_result(None)
+        if keep is not None and not keep(entry.result):
+            self._discard(entry_key, entry)
+        return entry.result, False
+
+    def _discard(self, entry_key, entry):
+        with self._lock:
+            if self._entries.get(entry_key) is entry:
+                del self._entries[entry_key]
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if entry.created >= cutoff:
+                break
+            self._entries.popitem(last=False)
+
+    def forget_owner(self, owner: Hashable):
+        with self._lock:
+            for entry_key in [k for k in self._entries if k[1] == str(owner)]:
+                del self._entries[entry_key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"keys": len(self._entries), "max_keys": self.max_keys, "replays": self.replays}
+
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,173 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Awaitable, Callable, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.models import Product
+from app.serialization import PRODUCT_COLUMNS
+from app.services.single_flight import AsyncSingleFlight, SingleFlight
+
+# Per-user product rows, shared by the product routes and the chatbot tools of
+# one worker process. Writes in this process invalidate immediately; the TTL
+# bounds staleness from writes made by other workers.
+INVENTORY_CACHE_MAX_ROWS = int(os.getenv("INVENTORY_CACHE_MAX_ROWS", "200000"))
+INVENTORY_CACHE_TTL = float(os.getenv("INVENTORY_CACHE_TTL", "60"))
+
+
+class InventoryCache:
+    """LRU cache of each user's product rows (PRODUCT_COLUMNS tuples), bounded by total row count"""
+
+    def __init__(self, max_rows: int = INVENTORY_CACHE_MAX_ROWS, ttl: float = INVENTORY_CACHE_TTL):
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()  # user_id -> (loaded_at, rows)
+        self._generations: dict = {}  # user_id -> bumped on every invalidation
+        self._epoch = 0  # bumped by clear()
+        self._rows = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.shared_loads = 0
+        # Concurrent misses for one user and generation share a single load
+        # (e.g. the chatbot's read-only tools, which run together)
+        self._flights = SingleFlight()
+        self._async_flights = AsyncSingleFlight()
+
+    def get(self, user_id: int, loader: Callable[[], list]) -> Tuple:
+        """Cached rows for `user_id`, calling `loader()` on a miss"""
+        now, rows, generation = self._lookup(user_id)
+        if rows is not None:
+            return rows
+        rows, shared = self._flights.do(
+            (user_id, generation), lambda: self._store(user_id, now, generation, tuple(loader()))
+        )
+        self._count_shared(shared)
+        return rows
+
+    async def aget(self, user_id: int, loader: Callable[[], Awaitable[list]]) -> Tuple:
+        """`get` with an async loader"""
+        now, rows, generation = self._lookup(user_id)
+        if rows is not None:
+            return rows
+
+        async def load():
+            return self._store(user_id, now, generation, tuple(await loader()))
+
+        # Keyed by loop too: a future can only be awaited on its own loop
+        rows, shared = await self._async_flights.do((user_id, generation, asyncio.get_running_loop()), load)
+        self._count_shared(shared)
+        return rows
+
+    def _count_shared(self, shared: bool):
+        if shared:
+            with self._lock:
+                self.shared_loads += 1
+
+    def _lookup(self, user_id: int):
+        """(now, cached rows or None, generation to check when storing a fresh load)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return now, entry[1], None
+            self.misses += 1
+            return now, None, (self._epoch, self._generations.get(user_id, 0))
+
+    def _store(self, user_id: int, now: float, generation, rows: Tuple) -> Tuple:
+        with self._lock:
+            # A write invalidated this user while we were loading: the rows may
+            # predate it, so hand them out but don't keep them.
+            if (self._epoch, self._generations.get(user_id, 0)) != generation:
+                return rows
+            self._drop(user_id)
+            if len(rows) <= self.max_rows:
+                self._entries[user_id] = (now, rows)
+                self._rows += len(rows)
+                while self._rows > self.max_rows:
+                    self._drop(next(iter(self._entries)))
+                    self.evictions += 1
+        return rows
+
+    def _drop(self, user_id: int):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._rows -= len(entry[1])
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self._drop(user_id)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._rows = 0
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "users": len(self._entries),
+                "rows": self._rows,
+                "max_rows": self.max_rows,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+                "shared_loads": self.shared_loads,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+inventory_cache = InventoryCache()
+
+
+def get_user_products(db: Session, user_id: int) -> Tuple:
+    """All of a user's product rows ordered by expiry date, read through the cache"""
+    return inventory_cache.get(
+        user_id,
+        lambda: db.query(*PRODUCT_COLUMNS)
+        .filter(Product.user_id == user_id)
+        .order_by(Product.expiry_date, Product.id)
+        .all(),
+    )
+
+
+async def get_user_products_async(db: AsyncSession, user_id: int) -> Tuple:
+    """`get_user_products` for an async session"""
+    async def load():
+        result = await db.execute(
+            select(*PRODUCT_COLUMNS)
+            .where(Product.user_id == user_id)
+            .order_by(Product.expiry_date, Product.id)
+        )
+        return result.all()
+
+    return await inventory_cache.aget(user_id, load)
+
+
+# Derived views over cached rows, replacing per-view queries
+
+def expiring_by(rows, until: date) -> list:
+    """Rows expiring on or before `until` (already expired ones included)"""
+    return [r for r in rows if r.expiry_date <= until]
+
+
+def expired_before(rows, today: date) -> list:
+    return [r for r in rows if r.expiry_date < today]
+
+
+def in_category(rows, category) -> list:
+    return [r for r in rows if r.category == category]
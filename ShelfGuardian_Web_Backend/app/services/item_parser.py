@@ -0,0 +1,115 @@
+"""Free-text parsing of item descriptions for add_item_tool.
+
+Kept free of database and LLM imports so it can be benchmarked on its own:
+
+    python -m benchmarks.bench_item_parser
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import NamedTuple, Optional
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10
+}
+_NUMBER_WORD_ALT = "|".join(NUMBER_WORDS)
+
+FOOD_KEYWORDS = [
+    "bread", "flour", "milk", "biscuit", "egg", "eggs", "rice", "cheese", "cookie", "juice", "butter", "noodle", "noodles",
+    "curd", "yogurt", "vegetable", "vegetables", "fruit", "fruits", "meat", "chicken", "fish", "grocery",
+]
+MEDICINE_KEYWORDS = ["paracetamol", "tablet", "syrup", "medicine", "ibuprofen", "antacid", "cough", "pain killer"]
+
+DATE_FORMATS = ("%d-%m-%Y", "%d/%m/%Y", "%Y-%m-%d", "%d-%m-%y", "%d/%m/%y")
+
+# Trailing "(user id: ...)" noise often appended by the LLM or in testing
+_USER_ID_NOISE = re.compile(r"\(\s*user\s*id[:=]?\s*\d+\s*\)$", re.IGNORECASE)
+_NAME = re.compile(
+    r"(?:add|please add|insert|create)?\s*([a-zA-Z0-9\s]+?)"
+    rf"(?=\s*(?:in\s+\d+\s+days|in\s+(?:{_NUMBER_WORD_ALT})\s+days|expir|expire|expires|expiring|on\s+\d|with|category|$))",
+    re.IGNORECASE,
+)
+_NAME_FALLBACK = re.compile(r"\s*(?:expir|expire|expires|expiry|on)\s*")
+# Leading count on the name: "2 milk", "three packets of biscuits" (not "1 kg rice")
+_QUANTITY = re.compile(
+    rf"^(\d+|{_NUMBER_WORD_ALT})\s+(?!(?:kg|g|gm|gms|mg|l|ml|ltr|litre|liter)s?\b)"
+    r"(?:(?:packets?|packs?|boxes|box|bottles?|units?|pieces?|pcs|strips?)\s+(?:of\s+)?)?",
+    re.IGNORECASE,
+)
+_DATE = re.compile(r"(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})")
+_IN_DAYS = re.compile(r"in\s+(\d+)\s+days?")
+_IN_DAYS_WORD = re.compile(rf"in\s+({_NUMBER_WORD_ALT})\s+days?")
+
+
+class ParsedItem(NamedTuple):
+    name: str
+    quantity: int
+    expiry_date: Optional[date]  # None when no expiry could be found
+    category: str  # ProductCategory member name: FOOD, MEDICINE or MISCELLANEOUS
+
+
+def clean_description(text: str) -> str:
+    desc = _USER_ID_NOISE.sub("", (text or "").strip().lower()).strip()
+    return desc.rstrip(" .,")
+
+
+def parse_name(desc: str) -> tuple:
+    """(name, quantity) from a cleaned description"""
+    match = _NAME.search(desc)
+    raw_name = match.group(1).strip() if match else None
+    if not raw_name:
+        # fallback to first word or phrase before 'expiry'
+        parts = _NAME_FALLBACK.split(desc)
+        raw_name = parts[0].strip() if parts and parts[0] else "Unnamed Product"
+
+    quantity = 1
+    count = _QUANTITY.match(raw_name)
+    if count and count.end() < len(raw_name):
+        word = count.group(1).lower()
+        quantity = int(word) if word.isdigit() else NUMBER_WORDS[word]
+        raw_name = raw_name[count.end():]
+
+    return re.sub(r"[(),]+$", "", raw_name).strip().title(), max(quantity, 1)
+
+
+def parse_expiry(desc: str, today: date) -> Optional[date]:
+    # explicit date
+    date_match = _DATE.search(desc)
+    if date_match:
+        date_str = date_match.group(1)
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(date_str, fmt).date()
+            except ValueError:
+                continue
+
+    # day phrases
+    if "day after tomorrow" in desc:
+        return today + timedelta(days=2)
+    if "tomorrow" in desc:
+        return today + timedelta(days=1)
+
+    # "in X days"
+    match_in_days = _IN_DAYS.search(desc)
+    if match_in_days:
+        return today + timedelta(days=int(match_in_days.group(1)))
+    match_in_days_word = _IN_DAYS_WORD.search(desc)
+    if match_in_days_word:
+        return today + timedelta(days=NUMBER_WORDS[match_in_days_word.group(1)])
+    return None
+
+
+def infer_category(name: str) -> str:
+    lowered = name.lower()
+    if any(k in lowered for k in FOOD_KEYWORDS):
+        return "FOOD"
+    if any(k in lowered for k in MEDICINE_KEYWORDS):
+        return "MEDICINE"
+    return "MISCELLANEOUS"
+
+
+def parse_item_description(text: str, today: date) -> ParsedItem:
+    """Parse e.g. "add 2 milk expiring in 3 days" into its fields, relative to `today`"""
+    desc = clean_description(text)
+    name, quantity = parse_name(desc)
+    return ParsedItem(name, quantity, parse_expiry(desc, today), infer_category(name))
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Hashable, Tuple
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    still in flight block and receive the same result (or exception). Nothing
+    is cached once the call finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run `fn` once per in-flight `key`. Returns (result, shared)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+# Result of a run whose leader was cancelled: its waiters start over
+_ABANDONED = object()
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines: concurrent callers on one event loop share a run"""
+
+    def __init__(self):
+        self._calls: dict = {}  # key -> asyncio.Future
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Await `fn()` once per in-flight `key`. Returns (result, shared).
+
+        If the caller running `fn` is cancelled, the others aren't: one of
+        them runs `fn` again and the rest wait for that run.
+        """
+        while True:
+            call = self._calls.get(key)
+            if call is None:
+                break
+            # shield: a waiter giving up must not cancel the leader's run
+            result = await asyncio.shield(call)
+            if result is not _ABANDONED:
+                return result, True
+
+        call = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            call.set_result(_ABANDONED)
+            raise
+        except BaseException as e:
+            call.set_exception(e)
+            call.exception()  # mark retrieved when nobody else was waiting
+            raise
+        else:
+            call.set_result(result)
+            return result, False
+        finally:
+            del self._calls[key]
+
+
+def normalize_message(message: str) -> str:
+    """Case- and whitespace-insensitive form of a chat message, used as a coalescing key"""
+    return " ".join((message or "").split()).lower()
+
+
+chat_flights = AsyncSingleFlight()
@@ -0,0 +1,195 @@
+"""Delta sync: what changed in a user's inventory since a client's cursor.
+
+Every product write stamps `updated_at` and bumps `version`; every delete
+leaves a row in product_tombstones. Changes and deletions are read as one
+stream ordered by (timestamp, kind, id), and the cursor handed to clients is
+an opaque encoding of the last position they received.
+
+Rows stamped within the last SYNC_SETTLE_SECONDS are held back: a transaction
+stamps its rows before it commits, so a row stamped just before another that
+a client already synced may only become visible afterwards. The window has to
+cover transaction duration plus clock skew between app servers.
+"""
+import base64
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Tuple
+from sqlalchemy import and_, delete, insert, inspect, literal, or_, select, text, true
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from app.models import Product, ProductTombstone
+from app.serialization import PRODUCT_COLUMNS, product_rows_to_dicts
+
+logger = logging.getLogger(__name__)
+
+SYNC_SETTLE_SECONDS = float(os.getenv("SYNC_SETTLE_SECONDS", "5"))
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "500"))
+# Tombstones older than this are purged; clients whose cursor is older get a
+# full resync (reset) instead. 0 keeps tombstones forever.
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.getenv("SYNC_TOMBSTONE_RETENTION_DAYS", "90"))
+
+# Ordering of the two streams at equal timestamps
+_CHANGED, _DELETED = 0, 1
+# Rank past both streams: a cursor at (t, _END, 0) covers everything up to t
+_END = 2
+
+Position = Tuple[datetime, int, int]
+
+
+# ------------------------------------------------
+# Cursors
+# ------------------------------------------------
+def encode_cursor(position: Position) -> str:
+    ts, rank, ident = position
+    raw = f"{ts.isoformat()}|{rank}|{ident}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Position:
+    """Inverse of encode_cursor; raises ValueError for anything malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        ts, rank, ident = raw.split("|")
+        return datetime.fromisoformat(ts), int(rank), int(ident)
+    except (TypeError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Invalid sync cursor") from e
+
+
+def _after(ts_column, id_column, rank: int, position: Optional[Position]):
+    """Filter for rows of the `rank` stream that come after `position`"""
+    if position is None:
+        return true()
+    ts, position_rank, ident = position
+    if rank > position_rank:
+        return ts_column >= ts
+    if rank < position_rank:
+        return ts_column > ts
+    return or_(ts_column > ts, and_(ts_column == ts, id_column > ident))
+
+
+# ------------------------------------------------
+# Change feed
+# ------------------------------------------------
+def changes_since(db: Session, user_id: int, cursor: Optional[str], limit: int = SYNC_PAGE_SIZE) -> dict:
+    """One page of `user_id`'s changes after `cursor` (None for a full sync).
+
+    `reset` tells the client to discard its local copy before applying the
+    page: its cursor predates the tombstones still kept, so deletions it
+    missed can't be listed.
+    """
+    now = datetime.utcnow()
+    horizon = now - timedelta(seconds=SYNC_SETTLE_SECONDS)
+    position = decode_cursor(cursor) if cursor else None
+
+    reset = False
+    if position is not None and SYNC_TOMBSTONE_RETENTION_DAYS > 0:
+        if position[0] < now - timedelta(days=SYNC_TOMBSTONE_RETENTION_DAYS):
+            position, reset = None, True
+
+    changed = db.execute(
+        select(*PRODUCT_COLUMNS)
+        .where(
+            Product.user_id == user_id,
+            Product.updated_at <= horizon,
+            _after(Product.updated_at, Product.id, _CHANGED, position),
+        )
+        .order_by(Product.updated_at, Product.id)
+        .limit(limit + 1)
+    ).all()
+    stream = [((row.updated_at, _CHANGED, row.id), row) for row in changed]
+
+    # A full sync returns every live product, so earlier deletions don't matter
+    if position is not None:
+        deleted = db.execute(
+            select(ProductTombstone.deleted_at, ProductTombstone.id, ProductTombstone.product_id)
+            .where(
+                ProductTombstone.user_id == user_id,
+                ProductTombstone.deleted_at <= horizon,
+                _after(ProductTombstone.deleted_at, ProductTombstone.id, _DELETED, position),
+            )
+            .order_by(ProductTombstone.deleted_at, ProductTombstone.id)
+            .limit(limit + 1)
+        ).all()
+        stream += [((row.deleted_at, _DELETED, row.id), row.product_id) for row in deleted]
+
+    stream.sort(key=lambda item: item[0])
+    has_more = len(stream) > limit
+    page = stream[:limit]
+    # Once caught up, everything up to the horizon has been seen
+    last = page[-1][0] if has_more else (horizon, _END, 0)
+
+    return {
+        "changed": product_rows_to_dicts(row for key, row in page if key[1] == _CHANGED),
+        "deleted": [product_id for key, product_id in page if key[1] == _DELETED],
+        "cursor": encode_cursor(last),
+        "has_more": has_more,
+        "reset": reset,
+    }
+
+
+# ------------------------------------------------
+# Tombstones
+# ------------------------------------------------
+def record_deletions(db: Session, user_id: int, product_ids: Iterable[int]):
+    """Add tombstones for deleted products; committed with the caller's delete"""
+    now = datetime.utcnow()
+    rows = [{"product_id": i, "user_id": user_id, "deleted_at": now} for i in product_ids]
+    if rows:
+        db.execute(insert(ProductTombstone), rows)
+
+
+def tombstones_from_select(where):
+    """INSERT of tombstones for the products matching `where`, to run before deleting them"""
+    return insert(ProductTombstone).from_select(
+        ["product_id", "user_id", "deleted_at"],
+        select(Product.id, Product.user_id, literal(datetime.utcnow(), ProductTombstone.deleted_at.type)).where(*where),
+    )
+
+
+def tombstone_partition(conn: Connection, partition: str):
+    """Tombstones for every row of a partition about to be dropped"""
+    conn.execute(text(
+        f"INSERT INTO {ProductTombstone.__tablename__} (product_id, user_id, deleted_at) "
+        f"SELECT id, user_id, :now FROM {partition}"
+    ), {"now": datetime.utcnow()})
+
+
+def purge_tombstones(db: Session, retention_days: int = SYNC_TOMBSTONE_RETENTION_DAYS) -> int:
+    """Delete tombstones past retention; older cursors get a reset instead"""
+    if retention_days <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    result = db.execute(delete(ProductTombstone).where(ProductTombstone.deleted_at < cutoff))
+    db.commit()
+    return result.rowcount
+
+
+# ------------------------------------------------
+# Schema
+# ------------------------------------------------
+def setup_sync_columns(engine: Engine):
+    """Add the change-tracking columns to a products table created before them (idempotent).
+
+    create_all only creates missing tables. Existing rows get the epoch as
+    their update time, written in SQLAlchemy's own SQLite format so they
+    compare correctly against stored timestamps.
+    """
+    columns = {c["name"] for c in inspect(engine).get_columns(Product.__tablename__)}
+    if {"updated_at", "version"} <= columns:
+        return
+    logger.info("Adding delta sync columns to %s", Product.__tablename__)
+    with engine.begin() as conn:
+        if "updated_at" not in columns:
+            conn.execute(text(
+                f"ALTER TABLE {Product.__tablename__} "
+                f"ADD COLUMN updated_at TIMESTAMP NOT NULL DEFAULT '1970-01-01 00:00:00.000000'"
+            ))
+        if "version" not in columns:
+            conn.execute(text(
+                f"ALTER TABLE {Product.__tablename__} ADD COLUMN version INTEGER NOT NULL DEFAULT 1"
+            ))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_products_user_updated "
+            f"ON {Product.__tablename__} (user_id, updated_at, id)"
+        ))
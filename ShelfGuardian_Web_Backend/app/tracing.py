@@ -0,0 +1,267 @@
+"""Lightweight in-process tracing: nested spans with durations, sampled per request.
+
+    with span("tool.find_item_tool", user_id=7):
+        ...
+
+A span opened with no span around it starts a trace, which is kept with
+probability TRACE_SAMPLE_RATE (or as decided by an incoming `traceparent`
+header). Spans opened inside it become its children, following the
+contextvars of the current task or thread; when the trace isn't sampled they
+cost one contextvar lookup. SQL statements get spans automatically, but only
+inside a sampled trace.
+
+Finished spans go through a bounded queue to a background thread that
+appends them to TRACE_FILE (one span per line) and/or POSTs them to
+TRACE_ZIPKIN_URL. Both use the Zipkin v2 JSON span format, which Zipkin,
+Jaeger and the OpenTelemetry collector's zipkin receiver accept.
+"""
+import atexit
+import functools
+import inspect
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+import orjson
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# 0 turns tracing off entirely
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_ZIPKIN_URL = os.getenv("TRACE_ZIPKIN_URL")  # e.g. http://localhost:9411/api/v2/spans
+TRACE_FILE = os.getenv("TRACE_FILE") or ("" if TRACE_ZIPKIN_URL else "traces.jsonl")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "shelfguardian-api")
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+
+_SQL_TAG_LENGTH = 500
+_BATCH_SIZE = 200
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "tags", "start_us", "_start", "duration_us")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], tags: dict):
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.tags = tags
+        self.start_us = time.time_ns() // 1000
+        self._start = time.perf_counter()
+        self.duration_us = 0
+
+    def set_tag(self, key: str, value):
+        self.tags[key] = value
+
+    def finish(self):
+        self.duration_us = max(1, int((time.perf_counter() - self._start) * 1_000_000))
+        exporter.export(self)
+
+    def to_zipkin(self) -> dict:
+        data = {
+            "traceId": self.trace_id,
+            "id": self.span_id,
+            "name": self.name,
+            "timestamp": self.start_us,
+            "duration": self.duration_us,
+            "localEndpoint": {"serviceName": TRACE_SERVICE_NAME},
+            "tags": {k: str(v) for k, v in self.tags.items() if v is not None},
+        }
+        if self.parent_id:
+            data["parentId"] = self.parent_id
+        return data
+
+
+# The innermost open span; _UNSAMPLED marks a trace that was not sampled, so
+# nested spans don't roll the dice again.
+_UNSAMPLED = object()
+_current: ContextVar = ContextVar("trace_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    parent = _current.get()
+    return parent if isinstance(parent, Span) else None
+
+
+def _start(name: str, tags: dict, traceparent: Optional[str] = None):
+    """New Span, or _UNSAMPLED when this trace isn't recorded"""
+    parent = _current.get()
+    if isinstance(parent, Span):
+        return Span(name, parent.trace_id, parent.span_id, tags)
+    if parent is _UNSAMPLED or TRACE_SAMPLE_RATE <= 0:
+        return _UNSAMPLED
+    match = _TRACEPARENT.match(traceparent or "")
+    if match:
+        # The caller already decided: follow its sampling flag
+        if not int(match.group(3), 16) & 1:
+            return _UNSAMPLED
+        return Span(name, match.group(1), match.group(2), tags)
+    if TRACE_SAMPLE_RATE < 1 and random.random() >= TRACE_SAMPLE_RATE:
+        return _UNSAMPLED
+    return Span(name, "%032x" % random.getrandbits(128), None, tags)
+
+
+@contextmanager
+def span(name: str, traceparent: Optional[str] = None, **tags):
+    """Time the enclosed block as a child of the current span (or as a new trace).
+
+    Yields the Span, or None when the trace isn't sampled. Exceptions are
+    recorded as an `error` tag and re-raised.
+    """
+    started = _start(name, tags, traceparent)
+    token = _current.set(started)
+    try:
+        yield started if isinstance(started, Span) else None
+    except BaseException as e:
+        if isinstance(started, Span):
+            started.tags["error"] = repr(e)
+        raise
+    finally:
+        _current.reset(token)
+        if isinstance(started, Span):
+            started.finish()
+
+
+def traced(name: str):
+    """Decorator: run each call of a sync or async function inside `span(name)`"""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ------------------------------------------------
+# SQL
+# ------------------------------------------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    parent = _current.get()
+    if isinstance(parent, Span):
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+        context._trace_span = Span(f"sql {verb}".rstrip(), parent.trace_id, parent.span_id, {
+            "db.system": conn.dialect.name,
+            "db.statement": statement[:_SQL_TAG_LENGTH],
+        })
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    sql_span = getattr(context, "_trace_span", None)
+    if sql_span is not None:
+        sql_span.set_tag("db.rows", cursor.rowcount)
+        sql_span.finish()
+        context._trace_span = None
+
+
+def _handle_error(exception_context):
+    context = exception_context.execution_context
+    sql_span = getattr(context, "_trace_span", None)
+    if sql_span is not None:
+        sql_span.set_tag("error", repr(exception_context.original_exception))
+        sql_span.finish()
+        context._trace_span = None
+
+
+# Listening on the Engine class covers every engine, including the sync side
+# of the async ones.
+if TRACE_SAMPLE_RATE > 0:
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+
+
+# ------------------------------------------------
+# Export
+# ------------------------------------------------
+class SpanExporter:
+    """Background writer of finished spans; drops (and counts) spans when its queue is full"""
+
+    def __init__(self, path: str, zipkin_url: Optional[str], max_queued: int = TRACE_QUEUE_SIZE):
+        self.path = path
+        self.zipkin_url = zipkin_url
+        self._queue: queue.Queue = queue.Queue(max_queued)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def export(self, finished: Span):
+        if self._thread is None:
+            self._start_thread()
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < _BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, batch):
+        spans = [s.to_zipkin() for s in batch]
+        try:
+            if self.path:
+                with open(self.path, "ab") as f:
+                    f.writelines(orjson.dumps(s) + b"\n" for s in spans)
+            if self.zipkin_url:
+                request = urllib.request.Request(
+                    self.zipkin_url, data=orjson.dumps(spans),
+                    headers={"Content-Type": "application/json"}, method="POST",
+                )
+                urllib.request.urlopen(request, timeout=5).close()
+            self.exported += len(spans)
+        except Exception as e:
+            self.failed += len(spans)
+            logger.warning("Failed to export %d spans: %s", len(spans), e)
+
+    def flush(self):
+        """Wait until queued spans are written"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def stats(self) -> dict:
+        return {
+            "sample_rate": TRACE_SAMPLE_RATE,
+            "queued": self._queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+exporter = SpanExporter(TRACE_FILE, TRACE_ZIPKIN_URL)
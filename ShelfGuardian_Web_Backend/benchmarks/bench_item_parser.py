@@ -0,0 +1,181 @@
+"""Accuracy and throughput of the add-item description parser.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_item_parser --items 20000
+    python -m benchmarks.bench_item_parser --corpus labelled.jsonl --show-errors 20
+
+Without --corpus a labelled corpus is generated from templates with a fixed
+seed, so runs are comparable across parser changes. A --corpus file has one
+JSON object per line:
+
+    {"text": "add 2 milk in 3 days", "name": "Milk", "quantity": 2,
+     "expiry_date": "2025-01-18", "category": "FOOD"}
+
+`expiry_date` may be null for descriptions without a usable date; dates are
+relative to --today. Only the parser runs: no database, no LLM.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import date, timedelta
+from typing import List
+
+from app.services.item_parser import NUMBER_WORDS, parse_item_description
+
+FIELDS = ("name", "quantity", "expiry_date", "category")
+DEFAULT_TODAY = date(2025, 1, 15)
+
+NAMES = {
+    "FOOD": ["milk", "brown bread", "eggs", "basmati rice", "cheddar cheese", "orange juice",
+             "butter", "curd", "chicken", "fish fillets", "mixed fruits", "wheat flour", "biscuits"],
+    "MEDICINE": ["paracetamol", "cough syrup", "ibuprofen", "antacid", "vitamin tablets", "pain killer"],
+    "MISCELLANEOUS": ["shampoo", "toothpaste", "sunscreen", "hand wash", "dish soap", "face cream"],
+}
+QUANTITY_WORDS = {v: k for k, v in NUMBER_WORDS.items()}
+CONTAINERS = ["packets of", "bottles of", "boxes of", "strips of"]
+
+
+def _expiry_phrase(rng: random.Random, today: date):
+    """(phrase, expected expiry date) in one of the forms users actually type"""
+    days = rng.randint(1, 400)
+    when = today + timedelta(days=days)
+    form = rng.randrange(9)
+    if form == 0:
+        return f"in {days} days", when
+    if form == 1 and days <= 10:
+        return f"in {QUANTITY_WORDS[days]} days", when
+    if form == 2:
+        return "tomorrow", today + timedelta(days=1)
+    if form == 3:
+        return "day after tomorrow", today + timedelta(days=2)
+    if form == 4:
+        return f"on {when:%d-%m-%Y}", when
+    if form == 5:
+        return f"on {when:%d/%m/%y}", when
+    if form == 6:
+        return f"{when:%Y-%m-%d}", when
+    if form == 7:
+        return f"{when.day}/{when.month}/{when.year}", when
+    return f"in {days} days", when
+
+
+def generate_corpus(items: int, seed: int, today: date) -> List[dict]:
+    rng = random.Random(seed)
+    verbs = ["add", "please add", "insert", "create", ""]
+    links = ["expiring", "expires", "expiry", ""]
+    corpus = []
+    for _ in range(items):
+        category = rng.choice(list(NAMES))
+        name = rng.choice(NAMES[category])
+        quantity = 1
+        item = name
+        roll = rng.random()
+        if roll < 0.25:
+            quantity = rng.randint(2, 12)
+            item = f"{quantity} {name}"
+        elif roll < 0.35:
+            quantity = rng.randint(2, 10)
+            item = f"{QUANTITY_WORDS[quantity]} {rng.choice(CONTAINERS)} {name}"
+
+        phrase, expiry = _expiry_phrase(rng, today)
+        link = rng.choice(links) if not phrase.startswith("in ") else ""
+        text = " ".join(p for p in (rng.choice(verbs), item, link, phrase) if p)
+        if rng.random() < 0.05:
+            text += f" (user id: {rng.randint(1, 99)})"
+        if rng.random() < 0.3:
+            text = text.capitalize()
+        corpus.append({
+            "text": text,
+            "name": name.title(),
+            "quantity": quantity,
+            "expiry_date": expiry.isoformat(),
+            "category": category,
+        })
+    return corpus
+
+
+def load_corpus(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _actual(parsed) -> dict:
+    return {
+        "name": parsed.name.lower(),
+        "quantity": parsed.quantity,
+        "expiry_date": parsed.expiry_date.isoformat() if parsed.expiry_date else None,
+        "category": parsed.category,
+    }
+
+
+def _expected(record: dict) -> dict:
+    return {
+        "name": (record.get("name") or "").lower(),
+        "quantity": record.get("quantity", 1),
+        "expiry_date": record.get("expiry_date"),
+        "category": record.get("category"),
+    }
+
+
+def evaluate(corpus: List[dict], today: date):
+    """Per-field and whole-record correct counts, plus the mismatching records"""
+    correct = dict.fromkeys(FIELDS, 0)
+    exact = 0
+    errors = []
+    for record in corpus:
+        actual, expected = _actual(parse_item_description(record["text"], today)), _expected(record)
+        wrong = [f for f in FIELDS if actual[f] != expected[f]]
+        for f in FIELDS:
+            correct[f] += f not in wrong
+        if wrong:
+            errors.append((record["text"], {f: (expected[f], actual[f]) for f in wrong}))
+        else:
+            exact += 1
+    return correct, exact, errors
+
+
+def throughput(texts: List[str], today: date, repeat: int) -> float:
+    """Best items/second over `repeat` passes"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            parse_item_description(text, today)
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="labelled JSONL file (default: generated corpus)")
+    parser.add_argument("--items", type=int, default=20_000, help="size of the generated corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--today", type=date.fromisoformat, default=DEFAULT_TODAY)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--show-errors", type=int, default=0, metavar="N")
+    parser.add_argument("--dump", metavar="PATH", help="write the corpus used to a JSONL file")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else generate_corpus(args.items, args.seed, args.today)
+    if args.dump:
+        with open(args.dump, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in corpus)
+
+    correct, exact, errors = evaluate(corpus, args.today)
+    rate = throughput([r["text"] for r in corpus], args.today, args.repeat)
+
+    total = len(corpus)
+    print(f"{total} items ({args.corpus or f'generated, seed {args.seed}'}), today={args.today}")
+    for f in FIELDS:
+        print(f"  {f:<12} {correct[f] / total:7.2%}")
+    print(f"  {'all fields':<12} {exact / total:7.2%}")
+    print(f"  throughput   {rate:,.0f} items/s (best of {args.repeat})")
+    for text, diff in errors[:args.show_errors]:
+        detail = ", ".join(f"{f}: expected {e!r} got {a!r}" for f, (e, a) in diff.items())
+        print(f"  ✗ {text!r}: {detail}")
+
+
+if __name__ == "__main__":
+    main()
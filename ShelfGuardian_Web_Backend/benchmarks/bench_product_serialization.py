@@ -0,0 +1,123 @@
+"""Compare product list serialization paths at inventory scale.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_product_serialization --rows 10000
+
+Uses a throwaway SQLite file unless DATABASE_URL is already set, so it never
+touches a real database by default.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import List
+
+_tmpdir = tempfile.mkdtemp(prefix="sg-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.models import Product, ProductCategory, User  # noqa: E402
+from app.schemas import ProductResponse  # noqa: E402
+from app.serialization import PRODUCT_COLUMNS, product_rows_response  # noqa: E402
+
+
+def seed(rows: int) -> int:
+    """Create one user owning `rows` products and return the user id"""
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = User(email="bench@example.com", username="bench", hashed_password="x")
+        db.add(user)
+        db.flush()
+        categories = list(ProductCategory)
+        today = date.today()
+        db.bulk_insert_mappings(Product, [
+            {
+                "name": f"Item {i}",
+                "category": categories[i % len(categories)],
+                "expiry_date": today + timedelta(days=i % 365),
+                "quantity": 1 + i % 5,
+                "description": "benchmark row" if i % 2 else None,
+                "user_id": user.id,
+            }
+            for i in range(rows)
+        ])
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def response_model_path(user_id: int) -> bytes:
+    """ORM rows -> List[ProductResponse] validation -> json.dumps (FastAPI with response_model)"""
+    db = SessionLocal()
+    try:
+        products = db.query(Product).filter(Product.user_id == user_id).all()
+        adapter = TypeAdapter(List[ProductResponse])
+        content = adapter.dump_python(adapter.validate_python(products), mode="json")
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    finally:
+        db.close()
+
+
+def jsonable_encoder_path(user_id: int) -> bytes:
+    """ORM rows -> ProductResponse per row -> jsonable_encoder -> json.dumps"""
+    db = SessionLocal()
+    try:
+        products = db.query(Product).filter(Product.user_id == user_id).all()
+        content = jsonable_encoder([ProductResponse.model_validate(p) for p in products])
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    finally:
+        db.close()
+
+
+def fast_path(user_id: int) -> bytes:
+    """Column tuples -> orjson bytes (app.serialization)"""
+    db = SessionLocal()
+    try:
+        rows = db.query(*PRODUCT_COLUMNS).filter(Product.user_id == user_id).all()
+        return product_rows_response(rows).body
+    finally:
+        db.close()
+
+
+def bench(fn, user_id: int, repeat: int) -> float:
+    fn(user_id)  # warm up
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(user_id)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    user_id = seed(args.rows)
+
+    # The fast path must produce the same document as the validated path.
+    assert json.loads(fast_path(user_id)) == json.loads(response_model_path(user_id))
+
+    results = [
+        ("response_model + json", bench(response_model_path, user_id, args.repeat)),
+        ("jsonable_encoder + json", bench(jsonable_encoder_path, user_id, args.repeat)),
+        ("column tuples + orjson", bench(fast_path, user_id, args.repeat)),
+    ]
+    baseline = results[0][1]
+    print(f"{args.rows} rows, best of {args.repeat}")
+    for label, seconds in results:
+        print(f"  {label:<26} {seconds * 1000:8.1f} ms  x{baseline / seconds:5.2f}")
+
+
+if __name__ == "__main__":
+    main()
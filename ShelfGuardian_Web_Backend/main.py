@@ -1,17 +1,34 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine, Base, SessionLocal
-from app.routers import auth, products, chat
+from app.database import engine, Base, SessionLocal, dispose_async_engines, pool_stats
+from app.routers import auth, products, chat, events
 import logging
-from datetime import datetime, timedelta
+import time
+import uuid
+from datetime import date, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 from sqlalchemy.orm import Session
-from app.models import Product
+from app.partitioning import setup_partitioning, create_future_partitions
+from app.logging_config import logging_stats, request_id_var, setup_logging, should_log_request
+from app.merge import setup_product_merge
+from app.search import setup_search_index
+from app.tracing import exporter as span_exporter, span
+from app.sync import purge_tombstones, setup_sync_columns
+from app.services.archive import ARCHIVE_AFTER_DAYS, archive_expired_products, purge_archive, setup_archive_columns
+from app.services.events import event_hub, publish_expiry_thresholds
+from app.services.idempotency import idempotency_store
+from app.services.inventory_cache import inventory_cache
 
 
+setup_logging()
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
+setup_sync_columns(engine)
+setup_archive_columns(engine)
+setup_partitioning(engine)
+setup_product_merge(engine)
+setup_search_index(engine)
 
 app = FastAPI(
     title="Expiry Tracker API",
@@ -19,46 +36,105 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# basic logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("expirytracker")
+access_logger = logging.getLogger("expirytracker.access")
 
 # ------------------------ EXPIRY CLEANUP LOGIC ------------------------
 
-def delete_expired_products():
+def archive_expired_products_job():
     db: Session = SessionLocal()
     try:
-        threshold_date = datetime.now() - timedelta(days=7)
-        deleted = db.query(Product).filter(Product.expiry_date < threshold_date).delete()
-        db.commit()
-
-        if deleted:
-            print(f"Deleted {deleted} expired products older than 7 days")
+        threshold_date = date.today() - timedelta(days=ARCHIVE_AFTER_DAYS)
+        moved = archive_expired_products(db, threshold_date)
+        if moved:
+            inventory_cache.clear()
+            event_hub.broadcast({"type": "resync"})
+        purged = purge_archive(db)
+        purge_tombstones(db)
+
+        if moved:
+            logger.info("Archived %d expired products older than %d days", moved, ARCHIVE_AFTER_DAYS)
         else:
-            print("No expired products to delete")
-    except Exception as e:
-        print("Error during cleanup:", e)
+            logger.info("No expired products to archive")
+        if purged:
+            logger.info("Purged %d archived products past retention", purged)
+    except Exception:
+        db.rollback()
+        logger.exception("Error during cleanup")
+    finally:
+        db.close()
+
+def expiry_events_job():
+    db: Session = SessionLocal()
+    try:
+        publish_expiry_thresholds(db)
+    except Exception:
+        logger.exception("Error publishing expiry events")
     finally:
         db.close()
 
 def start_scheduler():
     scheduler = BackgroundScheduler()
-    scheduler.add_job(delete_expired_products, "interval", days=1)
+    scheduler.add_job(archive_expired_products_job, "interval", days=1)
+    scheduler.add_job(create_future_partitions, "interval", days=1, args=[engine])
+    # Just after midnight, when products cross into the warning window or expire
+    scheduler.add_job(expiry_events_job, "cron", hour=0, minute=5)
     scheduler.start()
-    print("Scheduler started — expired product cleanup running daily")
+    logger.info("Scheduler started — expired product archiving running daily")
 
 # Start scheduler
 start_scheduler()
 
+
+@app.on_event("shutdown")
+async def close_async_engines():
+    await dispose_async_engines()
+
 # -------------------------- REQUEST LOGGING --------------------------
+# One structured record per request, written by the background log thread.
+# Clients may send X-Request-ID to correlate their logs with ours.
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    origin = request.headers.get("origin")
-    logger.info(f"Incoming request: {request.method} {request.url.path} Origin={origin}")
-    response = await call_next(request)
-    aca = response.headers.get("access-control-allow-origin")
-    logger.info(f"Response for {request.method} {request.url.path}: access-control-allow-origin={aca}")
-    return response
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    start = time.perf_counter()
+    try:
+        with span(
+            f"{request.method} {request.url.path}", traceparent=request.headers.get("traceparent"),
+            request_id=request_id, **{"http.method": request.method, "http.path": request.url.path},
+        ) as request_span:
+            response = await call_next(request)
+            if request_span is not None:
+                # Name the span after the route template, not the concrete URL
+                route = request.scope.get("route")
+                if route is not None:
+                    request_span.name = f"{request.method} {route.path}"
+                request_span.set_tag("http.status_code", response.status_code)
+        duration_ms = (time.perf_counter() - start) * 1000
+        response.headers["X-Request-ID"] = request_id
+        if should_log_request(response.status_code, duration_ms):
+            access_logger.info(
+                "%s %s %d", request.method, request.url.path, response.status_code,
+                extra={
+                    "method": request.method,
+                    "path": request.url.path,
+                    "status": response.status_code,
+                    "duration_ms": round(duration_ms, 2),
+                    "origin": request.headers.get("origin"),
+                    "allow_origin": response.headers.get("access-control-allow-origin"),
+                    "trace_id": request_span.trace_id if request_span is not None else None,
+                },
+            )
+        return response
+    except Exception:
+        access_logger.exception(
+            "%s %s failed", request.method, request.url.path,
+            extra={"method": request.method, "path": request.url.path,
+                   "duration_ms": round((time.perf_counter() - start) * 1000, 2)},
+        )
+        raise
+    finally:
+        request_id_var.reset(token)
 
 # --------------------------- CORS SETTINGS ----------------------------
 app.add_middleware(
@@ -99,6 +175,7 @@ async def debug_echo(request: Request):
 app.include_router(auth.router, prefix="/api/auth", tags=["authentication"])
 app.include_router(products.router, prefix="/api/products", tags=["products"])
 app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
+app.include_router(events.router, prefix="/api/events", tags=["events"])
 # ----------------------------- HEALTH -------------------------------
 @app.get("/")
 async def root():
@@ -106,4 +183,12 @@ async def root():
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "db_pools": pool_stats(),
+        "inventory_cache": inventory_cache.stats(),
+        "event_connections": event_hub.stats(),
+        "idempotency": idempotency_store.stats(),
+        "logging": logging_stats(),
+        "tracing": span_exporter.stats(),
+    }